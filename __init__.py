@@ -22,36 +22,52 @@ from .src.blendir_ui import (
     BLENDIR_MT_recent_pie,
     BLENDIR_MT_references_pie,
     BLENDIR_PT_main,
+    BLENDIR_UL_bookmarks,
+    BLENDIR_UL_references,
     draw_prefs,
 )
 from .src.bookmark import BLENDIR_PG_bookmark
 from .src.ops.blendir_ops import (
+    BLENDIR_OT_confirm_renames,
+    BLENDIR_OT_create_folders,
     BLENDIR_OT_directory_browser,
     BLENDIR_OT_export,
     BLENDIR_OT_import,
     BLENDIR_OT_open_preferences,
     BLENDIR_OT_open_reference,
+    BLENDIR_OT_reference_browser,
+    BLENDIR_OT_refresh_references,
     BLENDIR_OT_reset_props,
     BLENDIR_OT_save_blend,
     BLENDIR_OT_save_panel_category,
+    BLENDIR_OT_show_archive,
     BLENDIR_OT_start,
 )
 from .src.ops.bookmark_ops import (
     BLENDIR_OT_bookmarks,
-    BLENDIR_OT_change_page,
     BLENDIR_OT_edit_bookmarks,
     BLENDIR_OT_open_bookmark,
     BLENDIR_OT_open_bookmarks_pie,
+    BLENDIR_OT_search_bookmarks,
 )
 from .src.ops.recent_ops import BLENDIR_OT_edit_recent, BLENDIR_OT_open_recent
 from .src.ops.render_ops import BLENDIR_OT_render_animation, BLENDIR_OT_render_image
 from .src.ops.structure_ops import (
+    BLENDIR_OT_check_structure,
     BLENDIR_OT_delete_structure,
     BLENDIR_OT_edit_structure,
+    BLENDIR_OT_import_folders,
     BLENDIR_OT_import_structure,
     BLENDIR_OT_new_structure,
 )
-from .src.structure import init_structs, update_structs
+from .src.previews import register_previews, unregister_previews
+from .src.references import (
+    BLENDIR_PG_reference,
+    register_refresh,
+    unregister_refresh,
+)
+from .src.state import register_state, unregister_state
+from .src.structure import clear_lint_results, init_structs, update_structs
 from .src.utils import get_addon_id
 
 bl_info = {
@@ -72,7 +88,10 @@ class BLENDIR_PG_properties(bpy.types.PropertyGroup):
     old_path: StringProperty()
     reference_path: StringProperty()
     render_path: StringProperty()
-    bookmark_page: IntProperty()
+    # the folders of the last created structure, used to find renamed folders
+    structure_snapshot: StringProperty()
+    # the name of the structure the folders were created with
+    structure_name: StringProperty()
 
 
 class BLENDIR_AP_preferences(bpy.types.AddonPreferences):
@@ -81,7 +100,12 @@ class BLENDIR_AP_preferences(bpy.types.AddonPreferences):
     struct_data = init_structs()
     struct_items = struct_data[0]
     struct_icon = struct_data[1]
-    structure: EnumProperty(name="", description="Structure", items=update_structs)
+    structure: EnumProperty(
+        name="",
+        description="Structure",
+        items=update_structs,
+        update=clear_lint_results,
+    )
 
     # the previous save location
     last_path: StringProperty()
@@ -164,6 +188,43 @@ class BLENDIR_AP_preferences(bpy.types.AddonPreferences):
         description=("Show text beside buttons in the main panel"),
         default=False,
     )
+    folder_threads: IntProperty(
+        name="Folder Threads",
+        description=(
+            "Number of folders created at the same time. "
+            "Higher values make creating folders on network drives faster"
+        ),
+        default=1,
+        min=1,
+        max=32,
+    )
+    # archive properties
+    archive_keep_count: IntProperty(
+        name="Keep Last",
+        description=(
+            "Number of archived structures to keep as folders. "
+            "Older ones are compressed. 0 keeps all of them"
+        ),
+        default=0,
+        min=0,
+    )
+    archive_keep_days: IntProperty(
+        name="Keep Days",
+        description=(
+            "Archived structures newer than this many days are kept as folders. "
+            "Older ones are compressed. 0 keeps all of them"
+        ),
+        default=0,
+        min=0,
+    )
+    archive_format: EnumProperty(
+        name="",
+        description="File type of compressed archives",
+        items=[
+            ("TAR", "tar.gz", ""),
+            ("ZIP", "zip", ""),
+        ],
+    )
     panel_category: StringProperty(
         name="Panel Category", description="Location of add-on panel", default="Tool"
     )
@@ -175,18 +236,25 @@ class BLENDIR_AP_preferences(bpy.types.AddonPreferences):
 keymaps = []
 classes = (
     BLENDIR_OT_start,
+    BLENDIR_OT_create_folders,
+    BLENDIR_OT_confirm_renames,
     BLENDIR_OT_new_structure,
     BLENDIR_OT_edit_structure,
     BLENDIR_OT_delete_structure,
     BLENDIR_OT_import_structure,
+    BLENDIR_OT_check_structure,
+    BLENDIR_OT_import_folders,
     BLENDIR_OT_directory_browser,
     BLENDIR_OT_save_blend,
+    BLENDIR_OT_show_archive,
     BLENDIR_OT_bookmarks,
     BLENDIR_OT_open_bookmark,
     BLENDIR_OT_edit_bookmarks,
-    BLENDIR_OT_change_page,
     BLENDIR_OT_open_bookmarks_pie,
+    BLENDIR_OT_search_bookmarks,
     BLENDIR_OT_open_reference,
+    BLENDIR_OT_reference_browser,
+    BLENDIR_OT_refresh_references,
     BLENDIR_OT_reset_props,
     BLENDIR_OT_open_recent,
     BLENDIR_OT_edit_recent,
@@ -200,8 +268,11 @@ classes = (
     BLENDIR_MT_bookmarks_pie,
     BLENDIR_MT_references_pie,
     BLENDIR_MT_recent_pie,
+    BLENDIR_UL_bookmarks,
+    BLENDIR_UL_references,
     BLENDIR_PG_properties,
     BLENDIR_PG_bookmark,
+    BLENDIR_PG_reference,
     BLENDIR_AP_preferences,
 )
 
@@ -215,6 +286,24 @@ def register():
     bpy.types.Scene.blendir_bookmarks = bpy.props.CollectionProperty(
         type=BLENDIR_PG_bookmark
     )
+    # not saved in the blender file, the list is made when the browser is opened
+    bpy.types.WindowManager.blendir_references = bpy.props.CollectionProperty(
+        type=BLENDIR_PG_reference
+    )
+    bpy.types.WindowManager.blendir_reference_idx = bpy.props.IntProperty()
+    # the index the references were filled from, see fill_reference_items
+    bpy.types.WindowManager.blendir_references_generation = bpy.props.IntProperty()
+    bpy.types.WindowManager.blendir_bookmark_results = bpy.props.CollectionProperty(
+        type=BLENDIR_PG_bookmark
+    )
+    bpy.types.WindowManager.blendir_bookmark_idx = bpy.props.IntProperty()
+    # the index the results were filled from, see fill_bookmark_items
+    bpy.types.WindowManager.blendir_bookmark_results_generation = (
+        bpy.props.IntProperty()
+    )
+    register_state()
+    register_refresh()
+    register_previews()
 
     # add keymaps
     key_config = bpy.context.window_manager.keyconfigs.addon
@@ -254,11 +343,21 @@ def register():
 
 
 def unregister():
+    unregister_previews()
+    unregister_refresh()
+    unregister_state()
+
     # remove keymaps
     for keymap, keymap_item in keymaps:
         keymap.keymap_items.remove(keymap_item)
     keymaps.clear()
 
+    del bpy.types.WindowManager.blendir_bookmark_results_generation
+    del bpy.types.WindowManager.blendir_bookmark_idx
+    del bpy.types.WindowManager.blendir_bookmark_results
+    del bpy.types.WindowManager.blendir_references_generation
+    del bpy.types.WindowManager.blendir_reference_idx
+    del bpy.types.WindowManager.blendir_references
     del bpy.types.Scene.blendir_bookmarks
     del bpy.types.Scene.blendir_props
     for cls in reversed(classes):
@@ -0,0 +1,105 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+# micro-benchmark of validating, parsing and planning large structures
+# install and enable BlenDir, then run:
+# blender -b --python benchmarks/parse_benchmark.py -- [lines]
+
+import importlib
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+import bpy
+
+DEFAULT_LINES = 150000
+REPEATS = 3
+
+
+def get_addon():
+    # the add-on module name depends on how it was installed
+    for name in bpy.context.preferences.addons.keys():
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        if hasattr(module, "BLENDIR_AP_preferences"):
+            return name
+    raise SystemExit("Enable BlenDir before running the benchmark")
+
+
+def make_structure(line_count, bad_every):
+    # random depths, keywords, comments and invalid chars like real imported structures
+    random.seed(1)
+    lines = ["Project_*F"]
+    depth = 0
+    while len(lines) < line_count:
+        idx = len(lines)
+        depth = random.randint(1, min(depth + 1, 8))
+        name = f"Folder_{idx}"
+        if idx % 7 == 0:
+            name += "_*M"
+        if bad_every and idx % bad_every == 0:
+            name += ":"
+        lines.append("\t" * depth + name)
+        if idx % 50 == 0:
+            lines.append("\t" * depth + "// comment. with dots")
+    return lines
+
+
+def best_of(func):
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run(line_count):
+    addon = get_addon()
+    main = importlib.import_module(f"{addon}.src.blendir_main")
+    keywords = importlib.import_module(f"{addon}.src.keywords")
+    utils = importlib.import_module(f"{addon}.src.utils")
+
+    root_parent = pathlib.Path(tempfile.mkdtemp())
+    context = keywords.KeywordContext(root_parent / "benchmark.blend")
+    print(f"{'structure':<22}{'per line':>10}{'block':>10}{'parse':>10}{'plan':>10}")
+    for label, bad_every in (
+        ("valid", 0),
+        ("1 bad line in 500", 500),
+        ("every other line bad", 2),
+    ):
+        lines = make_structure(line_count, bad_every)
+
+        def per_line():
+            for line in lines:
+                utils.get_invalid_char(line, skip_keywords=True)
+
+        def block():
+            utils.find_invalid_chars(lines, skip_keywords=True)
+
+        def parse():
+            # collect errors instead of stopping at the first one
+            return main.parse_structure(lines, [])
+
+        nodes = parse()
+
+        def plan():
+            main.plan_folders(nodes, root_parent, context, [])
+
+        print(
+            f"{label:<22}"
+            f"{best_of(per_line):>9.3f}s"
+            f"{best_of(block):>9.3f}s"
+            f"{best_of(parse):>9.3f}s"
+            f"{best_of(plan):>9.3f}s"
+        )
+    print(f"{line_count} lines, best of {REPEATS}")
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+    run(int(argv[0]) if argv else DEFAULT_LINES)
@@ -0,0 +1,121 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+# stress test of the state files shared by blender instances
+# several blender processes add recent projects and bookmarks to the same files
+# at the same time, and nothing may be lost
+# install and enable BlenDir, then run:
+# blender -b --python benchmarks/state_stress.py -- [processes]
+
+import importlib
+import pathlib
+import subprocess
+import sys
+import tempfile
+
+import bpy
+
+DEFAULT_PROCESSES = 8
+OPENS = 60
+# projects each process opens, in turn
+PROJECTS = 10
+# a bookmark for every this many opens, next to one that every process adds
+BOOKMARK_EVERY = 3
+# compact often, so the log is rewritten while others append to it
+COMPACT_LINES = 30
+
+
+def get_addon():
+    # the add-on module name depends on how it was installed
+    for name in bpy.context.preferences.addons.keys():
+        try:
+            module = importlib.import_module(name)
+        except ImportError:
+            continue
+        if hasattr(module, "BLENDIR_AP_preferences"):
+            return name
+    raise SystemExit("Enable BlenDir before running the stress test")
+
+
+def use_dir(addon, dir_path):
+    # the state files are written to dir_path instead of the extension folder
+    utils = importlib.import_module(f"{addon}.src.utils")
+    state = importlib.import_module(f"{addon}.src.state")
+    utils._extension_dir_path = dir_path
+    for store in state.stores:
+        store._path = None
+        store.reset()
+
+
+def work(dir_path, worker_id):
+    addon = get_addon()
+    use_dir(addon, dir_path)
+    recent = importlib.import_module(f"{addon}.src.recent")
+    bookmark = importlib.import_module(f"{addon}.src.bookmark")
+    recent.COMPACT_LINES = COMPACT_LINES
+    recent.MAX_HISTORY = 1000
+    for idx in range(OPENS):
+        # the projects don't exist, so they aren't pruned
+        recent.add_recent(str(dir_path / "projects" / f"{worker_id}_{idx % PROJECTS}"))
+        if idx % BOOKMARK_EVERY == 0:
+            bookmark.add_bookmark(f"/bookmarks/{worker_id}/{idx}")
+        bookmark.add_bookmark("/bookmarks/shared")
+
+
+def run(process_count):
+    addon = get_addon()
+    dir_path = pathlib.Path(tempfile.mkdtemp())
+    processes = [
+        subprocess.Popen(
+            (
+                bpy.app.binary_path,
+                "-b",
+                "--python-exit-code",
+                "1",
+                "--python",
+                __file__,
+                "--",
+                "--worker",
+                str(dir_path),
+                str(worker_id),
+            ),
+            stdout=subprocess.DEVNULL,
+        )
+        for worker_id in range(process_count)
+    ]
+    failed = [process for process in processes if process.wait() != 0]
+    if failed:
+        raise SystemExit(f"{len(failed)} of {process_count} processes failed")
+
+    use_dir(addon, dir_path)
+    recent = importlib.import_module(f"{addon}.src.recent")
+    state = importlib.import_module(f"{addon}.src.state")
+    errors = []
+    bookmarks = state.bookmarks.get()
+    expected = {"/bookmarks/shared"}
+    for worker_id in range(process_count):
+        for idx in range(0, OPENS, BOOKMARK_EVERY):
+            expected.add(f"/bookmarks/{worker_id}/{idx}")
+    if len(bookmarks) != len(set(bookmarks)):
+        errors.append("duplicate bookmarks")
+    if set(bookmarks) != expected:
+        errors.append(f"{len(expected - set(bookmarks))} bookmarks lost")
+    projects = recent.get_history().projects.values()
+    if len(projects) != process_count * PROJECTS:
+        errors.append(f"{len(projects)} of {process_count * PROJECTS} projects")
+    # the scores barely decay while the test runs
+    score = sum(project.score for project in projects)
+    if abs(score - process_count * OPENS) > 0.01 * process_count * OPENS:
+        errors.append(f"score {score:.2f} instead of {process_count * OPENS}")
+    print(f"{process_count} processes, {OPENS} opens each")
+    print("\n".join(errors) if errors else "nothing was lost")
+    if errors:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    argv = sys.argv[sys.argv.index("--") + 1 :] if "--" in sys.argv else []
+    if argv[:1] == ["--worker"]:
+        work(pathlib.Path(argv[1]), argv[2])
+    else:
+        run(int(argv[0]) if argv else DEFAULT_PROCESSES)
@@ -0,0 +1,446 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+import json
+import os
+import pathlib
+import shutil
+import stat
+import tarfile
+import threading
+import time
+import zipfile
+
+import bpy
+
+from .blendir_main import BlenDirError
+from .utils import get_preferences
+
+INDEX_NAME = "index.json"
+
+
+def get_archive_path(old_path):
+    # folder where all old structures are moved to
+    return pathlib.Path(old_path).parent / "BlenDir_Archive"
+
+
+def get_folder_size(path):
+    size = 0
+    stack = [os.fspath(path)]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    size += entry.stat(follow_symlinks=False).st_size
+    return size
+
+
+def scan_archive(archive_path):
+    # build the index from the archived folders and compressed files
+    # this is only needed for archives made before there was an index
+    # or when the index is corrupt
+    index = {"next_slot": 0, "entries": []}
+    for path in archive_path.iterdir():
+        name = get_source_name(path.name)
+        compressed = name != path.name
+        s = name.split("_", 1)
+        if len(s) < 2 or not s[0].isdigit():
+            continue
+        if not (path.is_file() if compressed else path.is_dir()):
+            continue
+        slot = int(s[0])
+        entry = {
+            "slot": slot,
+            "name": s[1],
+            "folder": path.name,
+            "time": path.stat().st_mtime,
+            "structure": "",
+            # folders are measured later by measure_sizes
+            "size": path.stat().st_size if compressed else None,
+        }
+        if compressed:
+            entry["compressed"] = True
+        index["entries"].append(entry)
+        index["next_slot"] = max(index["next_slot"], slot + 1)
+    index["entries"].sort(key=lambda entry: entry["slot"])
+    return index
+
+
+# loaded indexes, keyed by path and validated with mtime
+_indexes = {}
+# the index is changed by the archive and the compression thread
+_index_lock = threading.Lock()
+
+
+def read_index(archive_path):
+    index_path = archive_path / INDEX_NAME
+    try:
+        mtime = index_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        if not archive_path.is_dir():
+            return {"next_slot": 0, "entries": []}
+        index = scan_archive(archive_path)
+        write_index(archive_path, index)
+        return index
+
+    cached = _indexes.get(index_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with index_path.open() as f:
+            index = json.load(f)
+        if not isinstance(index, dict) or set(index) != {"next_slot", "entries"}:
+            raise ValueError("Unknown archive index")
+    except ValueError:
+        # a corrupt index, for example from a full disk, is built again
+        index = scan_archive(archive_path)
+        write_index(archive_path, index)
+        return index
+    _indexes[index_path] = (mtime, index)
+    return index
+
+
+def write_index(archive_path, index):
+    # write to a temporary file first, so the index is never partly written
+    index_path = archive_path / INDEX_NAME
+    tmp_path = archive_path / (INDEX_NAME + ".tmp")
+    with tmp_path.open("w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path)
+    _indexes[index_path] = (index_path.stat().st_mtime_ns, index)
+
+
+def raise_error(error):
+    raise error
+
+
+def get_contents(path):
+    # relative path and size of every file in the folder, folders end with "/"
+    # links to files and folders are ("link", target), they aren't followed
+    # a folder that can't be listed is an error, so it's never left out silently
+    contents = {}
+    root = pathlib.Path(path)
+    for dir_path, dirs, files in os.walk(root, onerror=raise_error):
+        dir_path = pathlib.Path(dir_path)
+        contents[dir_path.relative_to(root.parent).as_posix() + "/"] = None
+        for name in dirs + files:
+            file_path = dir_path / name
+            rel_path = file_path.relative_to(root.parent).as_posix()
+            if file_path.is_symlink():
+                contents[rel_path] = ("link", os.readlink(file_path))
+            elif name in files:
+                contents[rel_path] = file_path.lstat().st_size
+    return contents
+
+
+def write_link(zipf, path, arcname):
+    # stored like the zip tool does, the target is the content of the entry
+    info = zipfile.ZipInfo(arcname)
+    # unix, so the link bits in the attributes are read when extracting
+    info.create_system = 3
+    info.external_attr = (stat.S_IFLNK | 0o777) << 16
+    zipf.writestr(info, os.readlink(path))
+
+
+def is_link(info):
+    return stat.S_ISLNK(info.external_attr >> 16)
+
+
+def get_compressed_path(path, file_format):
+    if file_format == "ZIP":
+        return path.with_name(path.name + ".zip")
+    return path.with_name(path.name + ".tar.gz")
+
+
+def get_source_name(name):
+    # the name of the folder a compressed file was made from
+    for extension in (".zip", ".tar.gz"):
+        if name.endswith(extension):
+            return name[: -len(extension)]
+    return name
+
+
+def compress_folder(path, file_format):
+    # returns the path of the compressed file
+    # files are streamed into the archive, so memory use stays low
+    dst = get_compressed_path(path, file_format)
+    if dst.exists():
+        # never replace a compressed file, it might be the only copy left
+        raise FileExistsError(f"{dst.name} exists already")
+    tmp_path = dst.with_name(dst.name + ".tmp")
+    contents = get_contents(path)
+    try:
+        if file_format == "ZIP":
+            with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+                for dir_path, dirs, files in os.walk(path, onerror=raise_error):
+                    dir_path = pathlib.Path(dir_path)
+                    # folders are written too, so empty ones are kept
+                    zipf.write(dir_path, dir_path.relative_to(path.parent))
+                    # links to folders are in dirs, but aren't walked
+                    for name in dirs + files:
+                        file_path = dir_path / name
+                        arcname = file_path.relative_to(path.parent).as_posix()
+                        if file_path.is_symlink():
+                            write_link(zipf, file_path, arcname)
+                        elif name in files:
+                            zipf.write(file_path, arcname)
+        else:
+            with tarfile.open(tmp_path, "w:gz") as tar:
+                tar.add(path, path.name)
+
+        # check that every file made it into the archive before deleting anything
+        if file_format == "ZIP":
+            with zipfile.ZipFile(tmp_path) as zipf:
+                if zipf.testzip() is not None:
+                    raise OSError(f"Compressed archive of {path.name} is corrupt")
+                stored = {}
+                for info in zipf.infolist():
+                    if info.is_dir():
+                        stored[info.filename] = None
+                    elif is_link(info):
+                        target = zipf.read(info).decode()
+                        stored[info.filename] = ("link", target)
+                    else:
+                        stored[info.filename] = info.file_size
+        else:
+            stored = {}
+            with tarfile.open(tmp_path, "r:gz") as tar:
+                for member in tar:
+                    if member.isdir():
+                        stored[member.name + "/"] = None
+                    elif member.issym():
+                        stored[member.name] = ("link", member.linkname)
+                    elif member.isfile():
+                        stored[member.name] = member.size
+                        # read the file, so the checksum is verified
+                        with tar.extractfile(member) as f:
+                            while f.read(1024 * 1024):
+                                pass
+        if stored != contents:
+            raise OSError(f"Compressed archive of {path.name} is incomplete")
+        if dst.exists():
+            raise FileExistsError(f"{dst.name} exists already")
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+    return dst
+
+
+def get_expired(entries, keep_count, keep_days):
+    # entries that aren't in the last keep_count or newer than keep_days
+    # 0 turns off that part of the policy
+    if keep_count == 0 and keep_days == 0:
+        return []
+    keep = set()
+    if keep_count > 0:
+        keep.update(entry["slot"] for entry in entries[-keep_count:])
+    if keep_days > 0:
+        oldest = time.time() - keep_days * 24 * 60 * 60
+        keep.update(entry["slot"] for entry in entries if entry["time"] >= oldest)
+    return [
+        entry
+        for entry in entries
+        if entry["slot"] not in keep and not entry.get("compressed", False)
+    ]
+
+
+# archive folders that are being compressed
+_compressing = set()
+
+
+def compress_archive(archive_path, keep_count, keep_days, file_format):
+    # compress old archived structures on a worker thread
+    with _index_lock:
+        if archive_path in _compressing:
+            return
+        expired = get_expired(
+            read_index(archive_path)["entries"], keep_count, keep_days
+        )
+        if not expired:
+            return
+        _compressing.add(archive_path)
+
+    def run():
+        nonlocal expired
+        # slots that couldn't be compressed, they will be tried again next time
+        failed = set()
+        try:
+            while expired:
+                for entry in expired:
+                    try:
+                        compress_entry(archive_path, entry, file_format)
+                    except Exception:
+                        # like a corrupt archive or a file that can't be read
+                        failed.add(entry["slot"])
+
+                with _index_lock:
+                    # structures might have been archived while compressing
+                    entries = read_index(archive_path)["entries"]
+                    expired = [
+                        entry
+                        for entry in get_expired(entries, keep_count, keep_days)
+                        if entry["slot"] not in failed
+                    ]
+            remove_compressed(archive_path)
+        except Exception:
+            # the index can't be read or written, compressing is tried next time
+            pass
+        finally:
+            with _index_lock:
+                _compressing.discard(archive_path)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def compress_entry(archive_path, entry, file_format):
+    path = archive_path / entry["folder"]
+    dst = compress_folder(path, file_format)
+    # the index is updated before the folder is deleted
+    # if deleting fails, the folder is never compressed again over the good file
+    with _index_lock:
+        index = read_index(archive_path)
+        for index_entry in index["entries"]:
+            if index_entry["slot"] == entry["slot"]:
+                index_entry["folder"] = dst.name
+                index_entry["compressed"] = True
+                index_entry["size"] = dst.stat().st_size
+        write_index(archive_path, index)
+    shutil.rmtree(path)
+
+
+def remove_compressed(archive_path):
+    # delete what is left of folders that couldn't be fully deleted before
+    with _index_lock:
+        entries = read_index(archive_path)["entries"]
+    for entry in entries:
+        if entry.get("compressed", False):
+            path = archive_path / get_source_name(entry["folder"])
+            if path.is_dir() and (archive_path / entry["folder"]).is_file():
+                shutil.rmtree(path, ignore_errors=True)
+
+
+# archive folders whose sizes are being measured
+_measuring = set()
+
+
+def measure_sizes(archive_path):
+    # listing every file of an archived structure can take long on a share
+    # so sizes are measured on a worker thread and stored in the index
+    with _index_lock:
+        if archive_path in _measuring:
+            return
+        _measuring.add(archive_path)
+
+    def run():
+        # folders that couldn't be measured, so they aren't tried again
+        failed = set()
+        try:
+            while True:
+                with _index_lock:
+                    entries = [
+                        entry
+                        for entry in read_index(archive_path)["entries"]
+                        if entry["size"] is None and entry["slot"] not in failed
+                    ]
+                if not entries:
+                    break
+                sizes = {}
+                for entry in entries:
+                    try:
+                        sizes[entry["slot"]] = get_folder_size(
+                            archive_path / entry["folder"]
+                        )
+                    except OSError:
+                        failed.add(entry["slot"])
+                with _index_lock:
+                    index = read_index(archive_path)
+                    for entry in index["entries"]:
+                        if entry["size"] is None and entry["slot"] in sizes:
+                            entry["size"] = sizes[entry["slot"]]
+                    write_index(archive_path, index)
+        except (OSError, ValueError):
+            # the index can't be read or written, sizes are measured next time
+            pass
+        finally:
+            with _index_lock:
+                _measuring.discard(archive_path)
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def archive(old_path):
+    # returns the path of the blender file
+    # a blender file in the old structure is archived with it, and isn't saved
+    # creating the folders moves it out of the archive and saves it once
+    old_path = pathlib.Path(old_path)
+    blend_path = pathlib.Path(bpy.data.filepath)
+    # check if old path exists
+    # also, if the first line is empty, the path would be ".", the current path
+    # so this has to be skipped as well
+    if old_path.is_dir() and str(old_path) != ".":
+        archive_path = get_archive_path(old_path)
+        try:
+            archive_path.mkdir(exist_ok=True)
+            with _index_lock:
+                new_path = add_to_archive(archive_path, old_path)
+        except (OSError, ValueError) as e:
+            raise BlenDirError(f"Error archiving the folder structure: {e}") from e
+
+        if old_path in blend_path.parents:
+            blend_path = new_path / blend_path.relative_to(old_path)
+
+        measure_sizes(archive_path)
+        prefs = get_preferences()
+        compress_archive(
+            archive_path,
+            prefs.archive_keep_count,
+            prefs.archive_keep_days,
+            prefs.archive_format,
+        )
+    return blend_path
+
+
+def add_to_archive(archive_path, old_path):
+    # returns the path of the archived folder
+    index = read_index(archive_path)
+    # the next slot is stored, so the archive doesn't have to be listed
+    slot = index["next_slot"]
+    new_path = archive_path / f"{slot}_{old_path.stem}"
+    while new_path.exists():
+        # the archive was changed outside of BlenDir
+        slot += 1
+        new_path = archive_path / f"{slot}_{old_path.stem}"
+    entry = {
+        "slot": slot,
+        "name": old_path.stem,
+        "folder": new_path.name,
+        "time": time.time(),
+        "structure": bpy.context.scene.blendir_props.structure_name,
+        # measured later by measure_sizes
+        "size": None,
+    }
+    # a new index, so the loaded one is unchanged if writing fails
+    new_index = dict(index, next_slot=slot + 1, entries=index["entries"] + [entry])
+    old_path.rename(new_path)
+    try:
+        write_index(archive_path, new_index)
+    except BaseException:
+        # keep the folders and the index in sync
+        new_path.rename(old_path)
+        raise
+    return new_path
+
+
+def format_size(size):
+    if size is None:
+        # not measured yet
+        return "..."
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
@@ -1,197 +1,903 @@
 # Copyright (C) 2022 Daniel Boxer
 # See __init__.py and LICENSE for more information
 
+import json
 import os
 import pathlib
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import bpy
 
-from .utils import get_datetime, get_invalid_char, get_preferences
-
-
-def read_structure(structure_path):
-    if structure_path.stat().st_size == 0:
+from .keywords import (
+    FLAG_KEYWORDS,
+    KeywordContext,
+    compile_template,
+    has_unknown_keyword,
+    render_template,
+)
+from .utils import find_invalid_chars, get_preferences, move_file
+
+
+class FolderNode:
+    def __init__(self, name, line_idx, depth):
+        # folder name with the flag keywords removed
+        # substitution keywords like *F are kept and replaced when creating folders
+        self.name = name
+        self.template = compile_template(name)
+        self.line_idx = line_idx
+        self.depth = depth
+        self.move_blend = False
+        self.bookmark = False
+        self.reference = False
+        self.render = False
+        self.children = []
+        # index of the folder and all its parents among their siblings
+        self.position = ()
+
+    def get_flags(self):
+        return [flag for flag in FLAG_KEYWORDS.values() if getattr(self, flag)]
+
+
+# compiled structures, keyed by path and validated with mtime and size
+_compiled = {}
+
+
+def get_structure_version(structure_path):
+    stat = structure_path.stat()
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def compile_structure(structure_path):
+    key = str(structure_path)
+    version = get_structure_version(structure_path)
+    cached = _compiled.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    if version[1] == 0:
         raise BlenDirError("Structure is empty")
+    with structure_path.open() as f:
+        nodes = parse_structure(f)
+    _compiled[key] = (version, nodes)
+    return nodes
 
-    props = bpy.context.scene.blendir_props
-    curr_blend_path = pathlib.Path(bpy.data.filepath)
-    bpy.context.scene.blendir_bookmarks.clear()
 
-    old_path = props.old_path
-    if old_path == "":
-        # if folder structure hasn't been created, use blender file path
-        new_path = curr_blend_path.parent
-    else:
-        # otherwise, the blender file might have moved, so use the stored path
-        new_path = pathlib.Path(old_path).parent
+def report_error(errors, line_idx, message):
+    # raise the error, or collect it when checking the whole structure
+    if errors is None:
+        raise BlenDirError(message)
+    errors.append((line_idx, message))
+
 
+def parse_structure(lines, errors=None):
+    # returns the folders at depth 0, the first one is the root folder
+    nodes = []
+    # stack of the folders the current line can be added to
+    parents = []
     # depth of -1 is the root folder
     # depth of 0 is the first folder in the structure
     previous_depth = -1
-    with structure_path.open() as f:
-        for line_idx, line in enumerate(f):
-            # check for invalid chars immediately because they'll mess up the path
-            invalid = get_invalid_char(line, skip_keywords=True)
-            if invalid is not None:
+    lines = list(lines)
+    # check all lines for invalid chars at once, only the first one per line is shown
+    invalid_chars = {}
+    for line_idx, _, char in find_invalid_chars(lines, skip_keywords=True):
+        invalid_chars.setdefault(line_idx, char)
+
+    for line_idx, line in enumerate(lines):
+        # check for invalid chars immediately because they'll mess up the path
+        invalid = invalid_chars.get(line_idx)
+        if invalid is not None:
+            report_error(
+                errors,
+                line_idx,
+                "Invalid Folder name." f" Remove '{invalid}' from line {line_idx+1}",
+            )
+
+        new_depth = line.count("\t")
+        if new_depth > previous_depth + 1:
+            extra = new_depth - previous_depth - 1
+            s = "s" if extra != 1 else ""
+            report_error(
+                errors,
+                line_idx,
+                "Invalid folder structure."
+                f" Line {line_idx+1} has {extra} extra tab{s}",
+            )
+
+        # remove tabs
+        line = line.strip()
+        # remove flag keywords, they don't change the folder name
+        flags = []
+        for keyword, flag in FLAG_KEYWORDS.items():
+            if keyword in line:
+                flags.append(flag)
+                line = line.replace(keyword, "")
+
+        if line.startswith("//") or line == "":
+            if line_idx == 0 and line.startswith("//"):
+                report_error(
+                    errors,
+                    line_idx,
+                    "The first line of the structure can't be a comment",
+                )
+            elif line_idx == 0 and line == "":
+                report_error(
+                    errors, line_idx, "The first line of the structure can't be empty"
+                )
+            continue
+
+        if has_unknown_keyword(line):
+            report_error(
+                errors,
+                line_idx,
+                "Invalid Folder name." f" Remove '*' from line {line_idx+1}",
+            )
+
+        node = FolderNode(line, line_idx, new_depth)
+        for flag in flags:
+            setattr(node, flag, True)
+
+        del parents[new_depth:]
+        if len(parents) < new_depth:
+            # the line has extra tabs, so it isn't added to the structure
+            # its subfolders are still checked
+            parents.extend([node] * (new_depth - len(parents)))
+        elif parents:
+            node.position = parents[-1].position + (len(parents[-1].children),)
+            parents[-1].children.append(node)
+        else:
+            node.position = (len(nodes),)
+            nodes.append(node)
+        parents.append(node)
+        previous_depth = new_depth
+
+    return nodes
+
+
+def get_root_parent(curr_blend_path):
+    old_path = bpy.context.scene.blendir_props.old_path
+    if old_path == "":
+        # if folder structure hasn't been created, use blender file path
+        return curr_blend_path.parent
+    # otherwise, the blender file might have moved, so use the stored path
+    return pathlib.Path(old_path).parent
+
+
+class CreateJob:
+    # creates a structure, the folders are planned and made on a worker thread
+    # everything that changes blender data is done in finish, on the main thread
+    # when syncing, only missing folders are added to the existing structure
+    # renamed and moved folders can also be found, see find_renames
+    # the blender file is moved on the worker thread, but isn't saved
+    # blend_path is where it will be saved
+    def __init__(self, structure_path, sync=False, rename=False, blend_path=""):
+        nodes = compile_structure(structure_path)
+
+        props = bpy.context.scene.blendir_props
+        if blend_path == "":
+            blend_path = bpy.data.filepath
+        self.blend_path = pathlib.Path(blend_path)
+        # an unsaved file has nothing to move, it's saved in the new location
+        self.is_saved = bpy.data.is_saved
+        # where the blender file is after the worker thread is done
+        self.new_blend_path = self.blend_path
+        # moving the file used to save it, see the report of create_folders
+        self.moved_blend = False
+        self.root_parent = get_root_parent(self.blend_path)
+        self.context = KeywordContext(self.blend_path)
+        # the worker thread can't use blender data, so every keyword is read now
+        self.context.read_all()
+        self.structure_name = structure_path.stem.split("blendir_", 1)[-1]
+        self.sync = sync
+        self.journal = Journal()
+        self.nodes = nodes
+        self.sync_root = None
+        # the structure the folders were created with, to find renames
+        self.old_entries = None
+        if sync:
+            if props.old_path == "":
                 raise BlenDirError(
-                    "Invalid Folder name." f" Remove '{invalid}' from line {line_idx+1}"
+                    "The folder structure hasn't been created yet. Press Start first"
                 )
-
-            new_depth = line.count("\t")
-            is_blend_moving = False
-            store_bookmark = False
-            store_ref_path = False
-            set_render_path = False
-
-            if new_depth > previous_depth + 1:
-                extra = new_depth - previous_depth - 1
-                s = "s" if extra != 1 else ""
+            self.sync_root = pathlib.Path(props.old_path)
+            if rename and props.structure_snapshot != "":
+                self.old_entries = json.loads(props.structure_snapshot)
+        # set by the worker thread when planning
+        self.plan = None
+        self.root_path = None
+        self.new_count = 0
+        # renames found when planning, they're done once they're confirmed
+        self.proposed_renames = []
+        # renames that were done
+        self.renames = []
+        self.rename_entries = 0
+        self.planned = threading.Event()
+        self.answered = threading.Event()
+
+        self.threads = get_preferences().folder_threads
+        self.error = None
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+        # stop waiting for the renames to be confirmed
+        self.answered.set()
+
+    def confirm(self):
+        self.answered.set()
+
+    def is_done(self):
+        return not self.thread.is_alive()
+
+    def is_planned(self):
+        return self.planned.is_set()
+
+    def is_waiting(self):
+        # true while the proposed renames haven't been confirmed, see confirm
+        return (
+            self.planned.is_set()
+            and bool(self.proposed_renames)
+            and not self.answered.is_set()
+        )
+
+    def get_progress(self):
+        # the journal only has new folders until the blender file is moved
+        return min(len(self.journal.entries) - self.rename_entries, self.new_count)
+
+    def set_plan(self, plan):
+        self.plan = plan
+        # the root folder path is only stored once the folders have been created
+        self.root_path = str(plan[0][0])
+        self.new_count = sum(1 for _, _, exists in plan if not exists)
+
+    def run(self):
+        try:
+            if self.sync and not self.sync_root.is_dir():
                 raise BlenDirError(
-                    "Invalid folder structure."
-                    f" Line {line_idx+1} has {extra} extra tab{s}"
+                    "The folder structure hasn't been created yet. Press Start first"
+                )
+            # keyword values were read in __init__, so no blender data is used
+            plan = plan_folders(
+                self.nodes, self.root_parent, self.context, sync_root=self.sync_root
+            )
+            if self.old_entries is not None:
+                self.proposed_renames = find_renames(
+                    self.old_entries, get_snapshot(plan)
+                )
+            self.set_plan(plan)
+            self.planned.set()
+            if self.proposed_renames:
+                self.answered.wait()
+                if self.cancelled.is_set():
+                    return
+                self.renames = apply_renames(
+                    self.sync_root, self.proposed_renames, self.journal
                 )
+                # plan again to see the renamed folders
+                self.set_plan(
+                    plan_folders(
+                        self.nodes,
+                        self.root_parent,
+                        self.context,
+                        sync_root=self.sync_root,
+                    )
+                )
+                self.rename_entries = len(self.journal.entries)
+            make_folders(self.plan, self.threads, self.journal, self.cancelled)
+            if self.cancelled.is_set():
+                return
+            # the blender file isn't moved when syncing
+            # without a *B folder, it's kept next to the structure
+            # this also moves it out of the archive, straight to its new location
+            blend_folder = get_blend_folder(self.plan)
+            if blend_folder is None:
+                blend_folder = self.root_parent
+            if not self.sync and blend_folder != self.blend_path.parent:
+                if self.is_saved:
+                    move_blend(blend_folder, self.blend_path, self.journal)
+                self.new_blend_path = blend_folder / self.blend_path.name
+        except BlenDirError as e:
+            self.error = e
+        except OSError as e:
+            self.error = BlenDirError(f"Error creating folders: {e}")
+        finally:
+            # also set if planning failed, so the caller stops waiting for it
+            self.planned.set()
+
+    def finish(self):
+        # returns False if creating folders was cancelled
+        if self.cancelled.is_set():
+            self.journal.rollback()
+            return False
+        if self.error is not None:
+            # undo only what this run did
+            self.journal.rollback()
+            raise self.error
+
+        # restored if this fails, so the next start doesn't see a created project
+        saved_props = get_project_props()
+        bpy.context.scene.blendir_bookmarks.clear()
+        try:
+            apply_keywords(self.plan)
+            # store the structure to find renamed folders next time
+            props = bpy.context.scene.blendir_props
+            props.structure_snapshot = json.dumps(get_snapshot(self.plan))
+            props.structure_name = self.structure_name
+            # store old root folder path
+            props.old_path = self.root_path
+        except BaseException:
+            self.journal.rollback()
+            set_project_props(saved_props)
+            raise
+        self.moved_blend = self.new_blend_path != self.blend_path
+        self.blend_path = self.new_blend_path
+        return True
+
+
+def get_project_props():
+    # the properties changed by creating a structure
+    scene = bpy.context.scene
+    props = scene.blendir_props
+    return (
+        [bookmark.path for bookmark in scene.blendir_bookmarks],
+        props.reference_path,
+        props.render_path,
+        scene.render.filepath,
+        props.structure_snapshot,
+        props.structure_name,
+        props.old_path,
+    )
+
+
+def set_project_props(values):
+    scene = bpy.context.scene
+    props = scene.blendir_props
+    bookmarks = values[0]
+    scene.blendir_bookmarks.clear()
+    for path in bookmarks:
+        scene.blendir_bookmarks.add().path = path
+    (
+        props.reference_path,
+        props.render_path,
+        scene.render.filepath,
+        props.structure_snapshot,
+        props.structure_name,
+        props.old_path,
+    ) = values[1:]
+
+
+def get_snapshot(plan):
+    # list of [relative path, position, flags, template] of the folders in the root
+    # the template is the relative path before keywords are replaced
+    root = plan[0][0]
+    snapshot = []
+    templates = {root: ""}
+    for path, node, _ in plan:
+        if path == root or root not in path.parents:
+            continue
+        rel_path = path.relative_to(root).as_posix()
+        parent_template = templates.get(path.parent, "")
+        template = f"{parent_template}/{node.name}" if parent_template else node.name
+        templates[path] = template
+        snapshot.append([rel_path, list(node.position), node.get_flags(), template])
+    return snapshot
+
+
+def find_renames(old_entries, new_entries):
+    # match the folders of the old and new structure
+    # a folder is moved if only one old folder has the same name and keywords
+    # names are compared before keywords are replaced, so a folder with a keyword
+    # like *D is the same folder on another day and isn't renamed to the new date
+    # if there are several, the one in the same position in the structure is used
+    # a folder that isn't matched by name is renamed if an old folder with the same
+    # parent and keywords was in its place, like a line that was edited
+    # returns a list of (old relative path, new relative path), parents first
+    # subfolders that are moved with their parent aren't in the list
+    # snapshots from older versions have no templates, so nothing is matched
+    old_entries = [entry for entry in old_entries if len(entry) == 4]
+    new_entries = [entry for entry in new_entries if len(entry) == 4]
+    old_paths = {entry[0] for entry in old_entries}
+    new_paths = {entry[0] for entry in new_entries}
+    old_templates = {entry[3] for entry in old_entries}
+    new_templates = {entry[3] for entry in new_entries}
+    # old path -> template
+    templates = {entry[0]: entry[3] for entry in old_entries}
+
+    def get_key(flags, template):
+        return (template.rsplit("/", 1)[-1], tuple(flags))
+
+    def get_parent(template):
+        return template.rpartition("/")[0]
+
+    # the folders that are gone
+    removed = [
+        entry
+        for entry in old_entries
+        # the folder is still there, or only the keyword values changed
+        if entry[0] not in new_paths and entry[3] not in new_templates
+    ]
+    by_name = {}
+    for path, position, flags, template in removed:
+        by_name.setdefault(get_key(flags, template), []).append((path, position))
+
+    unmatched = [
+        entry
+        for entry in new_entries
+        if entry[0] not in old_paths and entry[3] not in old_templates
+    ]
+    new_counts = {}
+    for _, _, flags, template in unmatched:
+        key = get_key(flags, template)
+        new_counts[key] = new_counts.get(key, 0) + 1
+
+    # new path -> old path
+    matches = {}
+    used = set()
+    for path, position, flags, template in unmatched:
+        key = get_key(flags, template)
+        if new_counts[key] != 1:
+            # several new folders could be the old one, so nothing is guessed
+            continue
+        candidates = by_name.get(key, [])
+        if len(candidates) > 1:
+            candidates = [c for c in candidates if c[1] == position]
+        if len(candidates) == 1 and candidates[0][0] not in used:
+            matches[path] = candidates[0][0]
+            used.add(candidates[0][0])
+
+    by_place = {}
+    for path, position, flags, template in removed:
+        if path not in used:
+            by_place[(get_parent(template), position[-1], tuple(flags))] = path
+    # new template -> old template of the matched folders
+    # so the subfolders of a renamed folder are found in their old parent
+    old_parents = {}
+    # new entries are in structure order, so parents come first
+    for path, position, flags, template in unmatched:
+        if path not in matches:
+            parent = get_parent(template)
+            key = (old_parents.get(parent, parent), position[-1], tuple(flags))
+            old_path = by_place.get(key)
+            if old_path is not None and old_path not in used:
+                matches[path] = old_path
+                used.add(old_path)
+        if path in matches:
+            old_parents[template] = templates[matches[path]]
+
+    renames = []
+    # (old path, new path) of the renames, their subfolders are moved with them
+    moved = []
+    for path, _, _, _ in unmatched:
+        if path not in matches:
+            continue
+        current = matches[path]
+        for moved_old, moved_new in moved:
+            if current.startswith(moved_old + "/"):
+                current = moved_new + current[len(moved_old) :]
+        if current != path:
+            renames.append((matches[path], path))
+            moved.append((current, path))
+    return renames
+
+
+def apply_renames(root, renames, journal):
+    # returns the renames that were done
+    done = []
+    # (old path, new path) of renamed folders, their subfolders moved with them
+    moved = []
+    for old_path, new_path in renames:
+        current = old_path
+        for moved_old, moved_new in moved:
+            if current == moved_old or current.startswith(moved_old + "/"):
+                current = moved_new + current[len(moved_old) :]
+        src = root / current
+        dst = root / new_path
+        if src == dst or not src.is_dir() or dst.exists():
+            continue
+        # the new parent might not exist yet
+        missing = []
+        for parent in dst.parents:
+            if parent.is_dir():
+                break
+            missing.append(parent)
+        for parent in reversed(missing):
+            parent.mkdir()
+            journal.add_folder(parent)
+        src.rename(dst)
+        journal.add_move(src, dst)
+        moved.append((current, new_path))
+        done.append((old_path, new_path))
+    return done
+
+
+# structure check results, keyed by structure name
+# (structure version, messages), so results of an edited structure aren't shown
+lint_results = {}
+
+
+def set_lint_results(struct_name, structure_path, errors):
+    version = get_structure_version(structure_path)
+    lint_results[struct_name] = (version, [message for _, message in errors])
+
+
+def get_lint_results(struct_name, structure_path):
+    # returns None if the structure wasn't checked or was changed since
+    result = lint_results.get(struct_name)
+    if result is None:
+        return None
+    try:
+        version = get_structure_version(structure_path)
+    except OSError:
+        version = None
+    if version != result[0]:
+        del lint_results[struct_name]
+        return None
+    return result[1]
+
+
+def get_lint_parent():
+    # returns the blender file path and the folder the structure would be made in
+    # or (None, None) if it isn't known yet
+    if bpy.data.is_saved:
+        curr_blend_path = pathlib.Path(bpy.data.filepath)
+        return curr_blend_path, get_root_parent(curr_blend_path)
+    # unsaved files are saved in a chosen folder, the browser starts in the last one
+    last_path = get_preferences().last_path
+    if last_path == "" or not os.path.isdir(last_path):
+        return None, None
+    return pathlib.Path(last_path) / "untitled.blend", pathlib.Path(last_path)
+
+
+def lint_structure(structure_path):
+    # check the whole structure in one pass
+    # returns every error and the folder the folders were checked in
+    # the folders aren't checked if that folder isn't known
+    errors = []
+    if structure_path.stat().st_size == 0:
+        errors.append((0, "Structure is empty"))
+        return errors, None
 
-            # remove tabs
-            line = line.strip()
-            # check for keywords and replace them
-            if "*F" in line:
-                line = line.replace("*F", curr_blend_path.stem)
-            if "*B" in line:
-                is_blend_moving = True
-                line = line.replace("*B", "")
-            if "*X" in line:
-                line = line.replace("*X", get_preferences().x_input)
-            if "*Y" in line:
-                line = line.replace("*Y", get_preferences().y_input)
-            if "*Z" in line:
-                line = line.replace("*Z", get_preferences().z_input)
-            if "*D" in line:
-                date = get_datetime()
-                line = line.replace("*D", date)
-            if "*M" in line:
-                line = line.replace("*M", "")
-                store_bookmark = True
-            if "*R" in line:
-                line = line.replace("*R", "")
-                store_ref_path = True
-            if "*O" in line:
-                line = line.replace("*O", "")
-                set_render_path = True
-
-            if line.startswith("//") or line == "":
-                if line_idx == 0 and line.startswith("//"):
-                    raise BlenDirError(
-                        "The first line of the structure can't be a comment"
+    with structure_path.open() as f:
+        nodes = parse_structure(f, errors)
+    curr_blend_path, root_parent = get_lint_parent()
+    if nodes and root_parent is not None:
+        context = KeywordContext(curr_blend_path)
+        # start archives the old structure first, so its folders don't collide
+        old_path = bpy.context.scene.blendir_props.old_path
+        archived_root = pathlib.Path(old_path) if old_path != "" else None
+        plan_folders(nodes, root_parent, context, errors, archived_root=archived_root)
+
+    errors.sort(key=lambda error: error[0])
+    return errors, root_parent
+
+
+# windows paths are limited to 260 characters unless long paths are enabled
+MAX_PATH_LENGTH = 260 if sys.platform == "win32" else 4096
+MAX_NAME_LENGTH = 255
+
+
+def is_case_insensitive(parent, names):
+    # a name with its case swapped is found on filesystems that ignore case
+    for name in names:
+        swapped = name.swapcase()
+        if swapped == name:
+            continue
+        if swapped in names:
+            # both exist, so case matters here
+            return False
+        return os.path.exists(os.path.join(parent, swapped))
+    # nothing to test with, use the default of the platform
+    return sys.platform in ("win32", "darwin")
+
+
+def plan_folders(
+    nodes, root_parent, context, errors=None, sync_root=None, archived_root=None
+):
+    # resolve every folder path before touching the filesystem
+    # the plan is a list of (path, node, exists) where parents come before children
+    # if sync_root is set, the structure is added to that existing root folder
+    # and folders that exist already are kept instead of being an error
+    # a root folder at archived_root is treated as missing, it's archived first
+    plan = []
+    sync = sync_root is not None
+    planned = set()
+    # names of the folders in each existing parent, each parent is only listed once
+    # names are keyed by their lowercase version to find case collisions
+    listings = {}
+    # parents on filesystems that ignore case, like the defaults on windows and macOS
+    ignore_case = set()
+    checking = errors is not None
+
+    def get_listing(parent):
+        listing = listings.get(parent)
+        if listing is None:
+            listing = {}
+            names = []
+            try:
+                with os.scandir(parent) as entries:
+                    for entry in entries:
+                        names.append(entry.name)
+                        if entry.is_dir():
+                            listing[entry.name.lower()] = entry.name
+            except FileNotFoundError:
+                pass
+            if is_case_insensitive(parent, names):
+                ignore_case.add(parent)
+            listings[parent] = listing
+        return listing
+
+    def add_nodes(nodes, parent_path, parent_is_new):
+        # names of the planned folders in this parent, keyed by their lowercase version
+        siblings = {}
+        for node in nodes:
+            line_idx = node.line_idx
+            name = render_template(node.template, context)
+            if name == "":
+                if line_idx == 0:
+                    report_error(
+                        errors,
+                        line_idx,
+                        "The first line of the structure can't be empty",
                     )
-                elif line_idx == 0 and line == "":
-                    raise BlenDirError("The first line of the structure can't be empty")
-                else:
                     continue
+                # keywords were replaced with empty input
+                if node.children:
+                    report_error(
+                        errors,
+                        line_idx,
+                        f"Line {line_idx+1} is empty after replacing keywords",
+                    )
+                continue
+            # unknown keywords are found when parsing, this catches replaced input
+            if "*" in name and not has_unknown_keyword(node.name):
+                report_error(
+                    errors,
+                    line_idx,
+                    "Invalid Folder name." f" Remove '*' from line {line_idx+1}",
+                )
 
-            # check for invalid input
-            if line_idx == 0 and (new_path / line).is_dir():
-                raise BlenDirError(
+            new_path = parent_path / name
+            if sync and line_idx == 0:
+                new_path = sync_root
+            # folders can't exist already if their parent is going to be created
+            listing = {} if parent_is_new else get_listing(parent_path)
+            if parent_path in ignore_case:
+                # mkdir would fail for a folder that only differs by case
+                exists = name.lower() in listing
+            else:
+                exists = listing.get(name.lower()) == name
+            if sync and line_idx == 0:
+                exists = True
+            elif line_idx == 0 and new_path == archived_root:
+                exists = False
+            elif new_path in planned:
+                report_error(
+                    errors,
+                    line_idx,
+                    f"Folder {name} is in the structure twice. Change line {line_idx+1}",
+                )
+            elif sync:
+                pass
+            elif exists and line_idx == 0:
+                report_error(
+                    errors,
+                    line_idx,
                     "Root folder exists already."
-                    " Change the name of the first folder in the structure"
+                    " Change the name of the first folder in the structure",
                 )
-            if "*" in line:
-                raise BlenDirError(
-                    "Invalid Folder name." f" Remove '*' from line {line_idx+1}"
+            elif exists:
+                report_error(
+                    errors,
+                    line_idx,
+                    f"Folder {name} exists already. Change line {line_idx+1}",
                 )
+            if checking and not exists:
+                # these only fail on some filesystems, so they're only checked here
+                other = siblings.get(name.lower(), listing.get(name.lower()))
+                if other is not None and other != name:
+                    report_error(
+                        errors,
+                        line_idx,
+                        f"Folder {name} only differs by case from {other}."
+                        f" Change line {line_idx+1}",
+                    )
+                if len(name) > MAX_NAME_LENGTH:
+                    report_error(
+                        errors,
+                        line_idx,
+                        f"Folder name is longer than {MAX_NAME_LENGTH} characters."
+                        f" Shorten line {line_idx+1}",
+                    )
+                elif len(str(new_path)) >= MAX_PATH_LENGTH:
+                    report_error(
+                        errors,
+                        line_idx,
+                        f"Folder path is longer than {MAX_PATH_LENGTH - 1} characters."
+                        f" Shorten line {line_idx+1}",
+                    )
 
-            if line_idx == 0:
-                # store old root folder path
-                props.old_path = str(new_path / line)
+            siblings[name.lower()] = name
+            plan.append((new_path, node, exists))
+            planned.add(new_path)
+            add_nodes(node.children, new_path, parent_is_new or not exists)
+
+    add_nodes(nodes, root_parent, False)
+    return plan
+
+
+def make_folders(plan, threads=1, journal=None, cancelled=None):
+    # stops early if the cancelled event is set
+    if journal is None:
+        journal = Journal()
+    if cancelled is None:
+        cancelled = threading.Event()
+    if threads > 1:
+        make_folders_parallel(plan, threads, journal, cancelled)
+        return
+    use_dir_fd = os.mkdir in os.supports_dir_fd and hasattr(os, "O_DIRECTORY")
+    if not use_dir_fd:
+        for path, _, exists in plan:
+            if cancelled.is_set():
+                return
+            if not exists:
+                path.mkdir()
+                journal.add_folder(path)
+        return
+
+    # create folders relative to an open parent folder
+    # this avoids resolving the full path again for every folder
+    flags = os.O_RDONLY | os.O_DIRECTORY
+    # stack of (path, file descriptor) of the parents of the current folder
+    fds = []
+    try:
+        for path, node, exists in plan:
+            if cancelled.is_set():
+                return
+            if exists:
+                continue
+            parent = path.parent
+            # close the folders of finished branches
+            while fds and fds[-1][0] != parent:
+                os.close(fds.pop()[1])
+            if not fds:
+                fds.append((parent, os.open(parent, flags)))
+            parent_fd = fds[-1][1]
+            os.mkdir(path.name, dir_fd=parent_fd)
+            journal.add_folder(path)
+            if node.children:
+                fds.append((path, os.open(path.name, flags, dir_fd=parent_fd)))
+    finally:
+        for _, fd in fds:
+            os.close(fd)
+
+
+def make_folders_parallel(plan, threads, journal, cancelled):
+    # folders at the same depth don't depend on each other
+    # so each level is created at once after the level above it is finished
+    levels = []
+    for path, node, exists in plan:
+        if node.depth == len(levels):
+            levels.append([])
+        if not exists:
+            levels[node.depth].append(path)
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for level in levels:
+            if cancelled.is_set():
+                return
+            futures = [executor.submit(path.mkdir) for path in level]
+            error = None
+            for path, future in zip(level, futures):
+                try:
+                    future.result()
+                except OSError as e:
+                    if error is None:
+                        error = e
+                else:
+                    journal.add_folder(path)
+            if error is not None:
+                # raise the error from the thread after all folders are journaled
+                raise error
 
-            if new_depth < previous_depth:
-                # if a subfolder branch is ended
-                new_path = new_path.parents[previous_depth - new_depth]
-            elif new_depth == previous_depth:
-                # if the next folder is in the same location
-                new_path = new_path.parent
 
-            # when adding a subfolder, it's added to the path with no changes needed
-            new_path /= line
-            previous_depth = new_depth
+def get_blend_folder(plan):
+    # the folder the blender file is moved to, or None
+    blend_folder = None
+    for path, node, _ in plan:
+        if node.move_blend:
+            blend_folder = path
+    return blend_folder
 
-            if new_path.is_dir():
-                raise BlenDirError(
-                    f"Folder {line} exists already. Change line {line_idx+1}"
-                )
 
-            if store_bookmark:
-                new_bookmark = bpy.context.scene.blendir_bookmarks.add()
-                new_bookmark.path = str(new_path)
-            if store_ref_path:
-                props.reference_path = str(new_path)
-            if set_render_path:
-                # add separator because it gets removed when casting to string
-                render_path = str(new_path) + os.sep
-                bpy.context.scene.render.filepath = render_path
-                props.render_path = render_path
+def apply_keywords(plan):
+    props = bpy.context.scene.blendir_props
+    for path, node, _ in plan:
+        if node.bookmark:
+            new_bookmark = bpy.context.scene.blendir_bookmarks.add()
+            new_bookmark.path = str(path)
+        if node.reference:
+            props.reference_path = str(path)
+        if node.render:
+            # add separator because it gets removed when casting to string
+            render_path = str(path) + os.sep
+            bpy.context.scene.render.filepath = render_path
+            props.render_path = render_path
+
+
+MAX_BACKUPS = 32
+MOVE_THREADS = 4
 
-            # make folder
-            new_path.mkdir()
 
-            if is_blend_moving:
-                move_blend(new_path)
+def move_backup(src, dst):
+    try:
+        move_file(src, dst)
+    except FileNotFoundError:
+        # there is no backup with this number
+        return False
+    return True
 
 
-def move_blend(new_path):
-    curr_blend_path = pathlib.Path(bpy.data.filepath)
+def move_blend(new_path, curr_blend_path, journal=None):
+    # the blender file isn't saved, so the caller has to save it to the returned path
+    # no blender data is used, so this can run on a worker thread
     new_blend_path = new_path / curr_blend_path.name
 
     # the backups have to be moved before the blender file
     # this is because it will create a backup when saving
-    for path in curr_blend_path.parent.iterdir():
-        # move all the backup files (.blend1, .blend2 ...)
-        s = path.suffix.split(".blend")
-        if (
-            path.is_file()
-            and len(s) > 1
-            and s[-1].isdigit()
-            and int(s[-1]) in range(1, 33)  # there can only be 32 backups
-            and curr_blend_path.stem == path.stem
-        ):
-            # the current path is a blender backup file of the current file
-            path.rename(new_blend_path.parent / path.name)
+    # there can only be 32 backups (.blend1, .blend2 ...)
+    backups = [
+        (
+            curr_blend_path.with_name(f"{curr_blend_path.name}{i}"),
+            new_blend_path.with_name(f"{new_blend_path.name}{i}"),
+        )
+        for i in range(1, MAX_BACKUPS + 1)
+    ]
+    # moving between filesystems copies, so the backups are moved concurrently
+    with ThreadPoolExecutor(max_workers=MOVE_THREADS) as executor:
+        futures = [executor.submit(move_backup, src, dst) for src, dst in backups]
+    error = None
+    for (src, dst), future in zip(backups, futures):
+        try:
+            moved = future.result()
+        except OSError as e:
+            error = e
+            continue
+        if moved and journal is not None:
+            journal.add_move(src, dst)
+    if error is not None:
+        raise BlenDirError(f"Error moving a backup file: {error}") from error
 
     try:
         # move blender file to the new location
-        curr_blend_path.rename(new_blend_path)
+        move_file(curr_blend_path, new_blend_path)
+        if journal is not None:
+            journal.add_move(curr_blend_path, new_blend_path)
     except FileNotFoundError as e:
         raise BlenDirError(
             "Error moving the Blender file while archiving. Try reopening the file"
         ) from e
-    # save as, so the filepath is changed in the blender file
-    bpy.ops.wm.save_as_mainfile(filepath=str(new_blend_path))
-
-
-def archive(old_path):
-    old_path = pathlib.Path(old_path)
-    # check if old path exists
-    # also, if the first line is empty, the path would be ".", the current path
-    # so this has to be skipped as well
-    if old_path.is_dir() and str(old_path) != ".":
-        root_path = old_path.parent
-        # check if blender file is in root folder already
-        if root_path != pathlib.Path(bpy.data.filepath).parent:
-            # move blender files to root folder
-            move_blend(root_path)
-
-        # folder where all old structures are moved to
-        archive = root_path / "BlenDir_Archive"
-        archive.mkdir(exist_ok=True)
-        suffix = 0
-        for path in archive.iterdir():
-            # check if there are other old structures
-            # the new suffix will be one greater than the previous
-            s = path.name.split("_")
-            if path.is_dir() and len(s) > 1 and s[0].isdigit() and int(s[0]) >= suffix:
-                suffix = int(s[0]) + 1
-
-        new_path = archive / (f"{suffix}_{old_path.stem}")
-        old_path.rename(new_path)
+    except OSError as e:
+        raise BlenDirError(f"Error moving the Blender file: {e}") from e
+    return new_blend_path
+
+
+def save_blend(blend_path):
+    # save once after everything that changes the blender file
+    # returns how long saving took
+    start = time.perf_counter()
+    if str(blend_path) != bpy.data.filepath:
+        # save as, so the filepath is changed in the blender file
+        bpy.ops.wm.save_as_mainfile(filepath=str(blend_path))
+    else:
+        bpy.ops.wm.save_mainfile()
+    return time.perf_counter() - start
 
 
 def make_render_folders():
@@ -222,6 +928,31 @@ def make_render_folders():
     return str(render_path) + os.sep
 
 
+class Journal:
+    # record of the changes made while creating a structure
+    def __init__(self):
+        self.entries = []
+
+    def add_folder(self, path):
+        self.entries.append(("FOLDER", path, None))
+
+    def add_move(self, src, dst):
+        self.entries.append(("MOVE", src, dst))
+
+    def rollback(self):
+        # undo changes in reverse order, so folders are empty when removed
+        while self.entries:
+            kind, path, dst = self.entries.pop()
+            try:
+                if kind == "MOVE":
+                    move_file(dst, path)
+                else:
+                    path.rmdir()
+            except OSError:
+                # leave anything that changed outside of BlenDir
+                continue
+
+
 # custom exception
 class BlenDirError(ValueError):
     pass
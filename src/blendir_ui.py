@@ -3,16 +3,15 @@
 
 import pathlib
 
-import bpy
-from bpy.types import Menu, Panel
+from bpy.types import Menu, Panel, UIList
 
-from .bookmark import get_bookmarks
+from .blendir_main import get_lint_results
+from .bookmark import get_bookmark_index, get_filled_bookmark_index
+from .previews import get_icon
 from .recent import get_recent
-from .utils import (
-    get_panel_category,
-    get_preferences,
-    get_references,
-)
+from .references import get_filled_index, get_references
+from .state import get_panel_category
+from .utils import get_active_path, get_preferences
 
 
 def draw_prefs(self, context, keymaps):
@@ -59,6 +58,12 @@ def draw_prefs(self, context, keymaps):
     col.prop(self, "autoload_refs")
     col.operator("blendir.edit_recent")
 
+    col = row.box().column()
+    col.label(text="Archive", icon="FILE_FOLDER")
+    col.prop(self, "archive_keep_count")
+    col.prop(self, "archive_keep_days")
+    col.prop(self, "archive_format")
+
     box = layout.box()
 
     row = box.row()
@@ -104,6 +109,7 @@ def draw_prefs(self, context, keymaps):
     row.label(text="Misc", icon="SETTINGS")
 
     box.prop(self, "verbose_ui")
+    box.prop(self, "folder_threads")
 
     split = box.split(factor=0.8)
     split.prop(self, "panel_category")
@@ -133,17 +139,40 @@ class BLENDIR_PT_main(Panel):
         row = box.row()
         row.scale_y = 2
         row.operator("blendir.start", icon="NEWFOLDER")
+        if context.scene.blendir_props.old_path != "":
+            row = box.row()
+            row.operator(
+                "blendir.create_folders", text="Sync Folders", icon="FILE_REFRESH"
+            ).sync = True
+            reapply = row.operator(
+                "blendir.create_folders", text="Re-apply", icon="FILE_PARENT"
+            )
+            reapply.sync = True
+            reapply.rename = True
+            row.operator("blendir.show_archive", text="", icon="FILE_FOLDER")
 
         row = box.row()
         row.scale_y = 2
         row.prop(prefs, "structure", icon="FILE")
 
+        errors = get_lint_results(prefs.structure, get_active_path())
+        if errors is not None:
+            col = box.box().column()
+            if not errors:
+                col.label(text="No problems found", icon="CHECKMARK")
+            # only show the first errors so the panel doesn't get too long
+            for message in errors[:10]:
+                col.label(text=message, icon="ERROR")
+            if len(errors) > 10:
+                col.label(text=f"And {len(errors) - 10} more")
+
         button_groups = (
             (
                 ("new_structure", "New Structure", "FILE_NEW"),
                 ("edit_structure", "Edit Structure", "GREASEPENCIL"),
                 ("delete_structure", "Delete Structure", "TRASH"),
                 ("import_structure", "Import Structure", "IMPORT"),
+                ("check_structure", "Check Structure", "VIEWZOOM"),
             ),
             (
                 ("render_image", "Render Image", "RENDER_STILL"),
@@ -173,56 +202,49 @@ class BLENDIR_MT_bookmarks_pie(Menu):
     bl_label = "Bookmarks"
 
     def draw(self, context):
-        page = context.scene.blendir_props.bookmark_page
         pie = self.layout.menu_pie()
-        bookmark_list = {}
-        # add all project bookmarks
-        if bpy.data.is_saved:
-            bookmarks = context.scene.blendir_bookmarks
-            for bookmark in bookmarks:
-                bookmark_list[bookmark.path] = "SOLO_OFF"
-        # add all saved bookmarks
-        for bookmark in get_bookmarks():
-            if bookmark != "":
-                bookmark_list[bookmark] = "SOLO_ON"
-
-        bookmark_count = len(bookmark_list)
-        low_idx = page * 8 - page
-        high_idx = low_idx + 8
-        iter_bookmarks = enumerate(list(bookmark_list.keys())[low_idx:], low_idx)
-        for bookmark_idx, bookmark in iter_bookmarks:
-            if bookmark_idx == high_idx:
-                # pie menu can only have 8 items
-                break
-            if bookmark_idx == low_idx and bookmark_count > 8:
-                box = pie.box()
-                row = box.row()
-                row.alignment = "CENTER"
-                row.label(text=f"Page {page + 1}", icon="BOOKMARKS")
-                if bookmark_count - high_idx >= 0:
-                    next_op = box.operator(
-                        "blendir.change_page",
-                        text="Next",
-                        icon="TRIA_RIGHT",
-                    )
-                    next_op.mode = "NEXT"
-
-                if page > 0:
-                    previous_op = box.operator(
-                        "blendir.change_page",
-                        text="Previous",
-                        icon="TRIA_LEFT",
-                    )
-                    previous_op.mode = "PREVIOUS"
-
-                # subtract 1 because two items will be drawn on this iteration
-                high_idx -= 1
-
+        index = get_bookmark_index(context)
+        # a pie has 8 items, the most used are shown and the rest are searched
+        ranked = index.ranked
+        shown = ranked if len(ranked) <= 8 else ranked[:7]
+        for bookmark_idx in shown:
+            path, is_project = index.bookmarks[bookmark_idx]
             pie.operator(
                 "blendir.open_bookmark",
-                text=pathlib.Path(bookmark).stem,
-                icon=bookmark_list[bookmark],
-            ).bookmark_idx = bookmark_idx
+                text=pathlib.Path(path).stem,
+                icon="SOLO_OFF" if is_project else "SOLO_ON",
+            ).path = path
+        if len(shown) < len(ranked):
+            pie.operator(
+                "blendir.search_bookmarks",
+                text=f"Search ({len(ranked)})",
+                icon="VIEWZOOM",
+            )
+
+
+class BLENDIR_UL_bookmarks(UIList):
+    def draw_item(
+        self, context, layout, data, item, icon, active_data, active_propname, index
+    ):
+        row = layout.row()
+        row.operator(
+            "blendir.open_bookmark", text=item.name, icon="BOOKMARKS", emboss=False
+        ).path = item.path
+        row.label(text=item.path)
+
+    def draw_filter(self, context, layout):
+        layout.prop(self, "filter_name", text="", icon="VIEWZOOM")
+
+    def filter_items(self, context, data, propname):
+        index = get_filled_bookmark_index()
+        if (
+            index is None
+            or data.blendir_bookmark_results_generation != index.generation
+        ):
+            # the list hasn't been filled from this index yet
+            return [], []
+        # the search uses the index instead of matching every item name
+        return index.get_filter(self.filter_name, self.bitflag_filter_item)
 
 
 class BLENDIR_MT_references_pie(Menu):
@@ -230,15 +252,71 @@ class BLENDIR_MT_references_pie(Menu):
 
     def draw(self, context):
         pie = self.layout.menu_pie()
-        for ref_idx, ref in enumerate(get_references()[0]):
-            if ref_idx < 8:
-                pie.operator(
-                    "blendir.open_reference",
-                    text=ref,
-                    icon="IMAGE_REFERENCE",
-                ).reference_idx = ref_idx
+        # drawn from the cached snapshot, the folder isn't listed on every redraw
+        try:
+            refs = get_references()
+        except OSError as e:
+            pie.label(text=f"Reference folder unavailable: {e.strerror}", icon="ERROR")
+            return
+        # a pie has 8 items, the rest are found with the browser
+        shown = refs.names if len(refs.names) <= 8 else refs.names[:7]
+        for ref in shown:
+            icon_id = get_icon(refs, ref)
+            if icon_id:
+                op = pie.operator(
+                    "blendir.open_reference", text=ref, icon_value=icon_id
+                )
             else:
-                break
+                op = pie.operator(
+                    "blendir.open_reference", text=ref, icon="IMAGE_REFERENCE"
+                )
+            op.reference = ref
+        if len(shown) < len(refs.names):
+            pie.operator(
+                "blendir.reference_browser",
+                text=f"More ({len(refs.names) - len(shown)})",
+                icon="VIEWZOOM",
+            )
+
+
+class BLENDIR_UL_references(UIList):
+    def draw_item(
+        self, context, layout, data, item, icon, active_data, active_propname, index
+    ):
+        index = get_filled_index()
+        icon_id = get_icon(index.snapshot, item.path) if index is not None else 0
+        row = layout.row()
+        if icon_id:
+            op = row.operator(
+                "blendir.open_reference",
+                text=item.name,
+                icon_value=icon_id,
+                emboss=False,
+            )
+        else:
+            op = row.operator(
+                "blendir.open_reference",
+                text=item.name,
+                icon="IMAGE_REFERENCE",
+                emboss=False,
+            )
+        op.reference = item.path
+        folder = item.path.rpartition("/")[0]
+        if folder:
+            row.label(text=folder)
+
+    def draw_filter(self, context, layout):
+        row = layout.row()
+        row.prop(self, "filter_name", text="", icon="VIEWZOOM")
+        row.label(text="'.png' for file types, 'folder/' for subfolders")
+
+    def filter_items(self, context, data, propname):
+        index = get_filled_index()
+        if index is None or data.blendir_references_generation != index.generation:
+            # the list hasn't been filled from this index yet
+            return [], []
+        # the search uses the index instead of matching every item name
+        return index.get_flags(self.filter_name, self.bitflag_filter_item), []
 
 
 class BLENDIR_MT_recent_pie(Menu):
@@ -246,9 +324,9 @@ class BLENDIR_MT_recent_pie(Menu):
 
     def draw(self, context):
         pie = self.layout.menu_pie()
-        for path_idx, path in enumerate(get_recent()):
+        for path in get_recent():
             pie.operator(
                 "blendir.open_recent",
                 text=pathlib.Path(path).stem,
                 icon="BLENDER",
-            ).recent_idx = path_idx
+            ).path = path
@@ -1,25 +1,26 @@
 # Copyright (C) 2022 Daniel Boxer
 # See __init__.py and LICENSE for more information
 
+import bisect
+import pathlib
+
 import bpy
+from . import state
 from .blendir_main import BlenDirError
 from .utils import get_bookmark_path, open_file
 
 
 def add_bookmark(bookmark):
-    path = get_bookmark_path()
-    with path.open("a") as f:
-        f.write(bookmark + "\n")
+    state.bookmarks.add(bookmark)
 
 
 def get_bookmarks():
-    bookmarks = []
-    path = get_bookmark_path()
-    if path.is_file():
-        with path.open("r") as f:
-            for line in f:
-                bookmarks.append(line.strip())
-    return bookmarks
+    # served from memory, see state
+    return state.bookmarks.get()
+
+
+def is_bookmarked(bookmark):
+    return bookmark in state.bookmarks
 
 
 def open_bookmarks():
@@ -30,5 +31,138 @@ def open_bookmarks():
         raise BlenDirError("No bookmarks to edit, try adding some with the browser")
 
 
+def parse_usage(lines):
+    usage = {}
+    for line in lines:
+        count, _, path = line.partition("\t")
+        if count.isdigit() and path != "":
+            usage[path] = usage.get(path, 0) + int(count)
+    return usage
+
+
+def add_bookmark_use(bookmark):
+    # count how often a bookmark is opened, to rank the search results
+    def get_lines(lines):
+        usage = parse_usage(lines)
+        usage[bookmark] = usage.get(bookmark, 0) + 1
+        return [f"{count}\t{path}" for path, count in usage.items()]
+
+    state.bookmark_usage.update(get_lines)
+
+
+class BookmarkIndex:
+    # search index over the project and saved bookmarks
+    def __init__(self, key, bookmarks, usage, generation):
+        self.key = key
+        # stored with the search list, so a list filled from another index is found
+        self.generation = generation
+        # (path, is project bookmark), in the order they are drawn without a search
+        self.bookmarks = bookmarks
+        self.names = [pathlib.Path(path).name for path, _ in bookmarks]
+        self._paths = [path.lower() for path, _ in bookmarks]
+        self._uses = [usage.get(path, 0) for path, _ in bookmarks]
+        # sorted names, to find names that start with the query without a full search
+        self._sorted_names = sorted(
+            (name.lower(), idx) for idx, name in enumerate(self.names)
+        )
+        self._filter_query = None
+        self._filter = ([], [])
+        # most used first, otherwise in the saved order
+        self.ranked = sorted(
+            range(len(self.bookmarks)), key=lambda idx: -self._uses[idx]
+        )
+
+    def search(self, query):
+        # bookmarks whose name starts with the query come first, then the ones
+        # with the query anywhere in their path, each sorted by how often they're used
+        query = query.lower().strip()
+        if query == "":
+            return self.ranked
+        start = bisect.bisect_left(self._sorted_names, (query,))
+        prefix = []
+        for name, idx in self._sorted_names[start:]:
+            if not name.startswith(query):
+                break
+            prefix.append(idx)
+        found = set(prefix)
+        other = [
+            idx
+            for idx, path in enumerate(self._paths)
+            if idx not in found and query in path
+        ]
+        prefix.sort(key=lambda idx: -self._uses[idx])
+        other.sort(key=lambda idx: -self._uses[idx])
+        return prefix + other
+
+    def get_filter(self, query, flag):
+        # filter flags and order for a UIList, only made again when the query changes
+        if query != self._filter_query:
+            flags = [0] * len(self.bookmarks)
+            order = list(range(len(self.bookmarks)))
+            results = self.search(query)
+            for position, idx in enumerate(results):
+                flags[idx] = flag
+                order[idx] = position
+            # the hidden items go after the results
+            hidden = [idx for idx in range(len(self.bookmarks)) if not flags[idx]]
+            for position, idx in enumerate(hidden, len(results)):
+                order[idx] = position
+            self._filter = (flags, order)
+            self._filter_query = query
+        return self._filter
+
+
+_index = None
+# counts the indices that were built
+_generation = 0
+
+
+def get_bookmark_index(context):
+    # the index is only built again when the bookmarks or their usage change
+    global _index, _generation
+    project = ()
+    if bpy.data.is_saved:
+        project = tuple(bookmark.path for bookmark in context.scene.blendir_bookmarks)
+    saved = state.bookmarks.get()
+    usage_lines = state.bookmark_usage.get()
+    key = (project, state.bookmarks.version, state.bookmark_usage.version)
+    if _index is None or _index.key != key:
+        bookmarks = {}
+        for path in project:
+            bookmarks[path] = True
+        for path in saved:
+            bookmarks.setdefault(path, False)
+        _generation += 1
+        _index = BookmarkIndex(
+            key, list(bookmarks.items()), parse_usage(usage_lines), _generation
+        )
+    return _index
+
+
+_filled_index = None
+
+
+def fill_bookmark_items(context):
+    # copy the indexed bookmarks to the collection the search list is drawn from
+    global _filled_index
+    index = get_bookmark_index(context)
+    window_manager = context.window_manager
+    if window_manager.blendir_bookmark_results_generation == index.generation:
+        return
+    items = window_manager.blendir_bookmark_results
+    items.clear()
+    for name, (path, _) in zip(index.names, index.bookmarks):
+        item = items.add()
+        item.name = name
+        item.path = path
+    window_manager.blendir_bookmark_results_generation = index.generation
+    _filled_index = index
+
+
+def get_filled_bookmark_index():
+    # the index the search list was filled from
+    return _filled_index
+
+
 class BLENDIR_PG_bookmark(bpy.types.PropertyGroup):
     path: bpy.props.StringProperty()
@@ -0,0 +1,98 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+import errno
+import os
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+# seconds the UI waits for a file system call before continuing without it
+TIMEOUT = 0.25
+# seconds a result is reused
+CACHE_TTL = 2.0
+# results are cleaned up when there are more than this
+MAX_CACHE = 256
+
+# key -> (expire time, result, error)
+_cache = {}
+# key -> (future, start time) of the call that is running
+_running = {}
+_lock = threading.Lock()
+
+
+class UnavailableError(OSError):
+    # the file system didn't answer in time, for example an unreachable network drive
+    def __init__(self, path):
+        super().__init__(errno.ETIMEDOUT, "Not responding", str(path))
+
+
+def run(future, func, args):
+    try:
+        future.set_result(func(*args))
+    except BaseException as e:
+        future.set_exception(e)
+
+
+def store(key, future, ttl):
+    # cache the result when the call finishes, even if the caller stopped waiting
+    error = future.exception()
+    result = None if error is not None else future.result()
+    now = time.monotonic()
+    with _lock:
+        _running.pop(key, None)
+        if len(_cache) > MAX_CACHE:
+            for old_key, (expires, _, _) in list(_cache.items()):
+                if expires <= now:
+                    del _cache[old_key]
+        _cache[key] = (now + ttl, result, error)
+
+
+def call(func, *args, timeout=TIMEOUT, ttl=CACHE_TTL):
+    # run func(*args) on a worker thread and wait at most timeout seconds
+    # raises UnavailableError if it takes longer, the result is cached when it's done
+    # each call gets its own daemon thread, so a hung drive can't block other calls
+    # or closing blender
+    # timeout counts from when the running call started, so callers don't wait again
+    # for a call that has already taken too long, like redraws of a hung drive
+    key = (func.__module__, func.__qualname__, args)
+    with _lock:
+        cached = _cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            _, result, error = cached
+            if error is not None:
+                raise error
+            return result
+        if key in _running:
+            future, started = _running[key]
+        else:
+            # only one call runs for the same arguments
+            future = Future()
+            started = time.monotonic()
+            future.add_done_callback(lambda f: store(key, f, ttl))
+            _running[key] = (future, started)
+            threading.Thread(target=run, args=(future, func, args), daemon=True).start()
+    try:
+        return future.result(max(started + timeout - time.monotonic(), 0))
+    except FutureTimeoutError:
+        raise UnavailableError(args[0] if args else func.__name__) from None
+
+
+def forget(func, *args):
+    # the next call with these arguments runs again, instead of using the cache
+    with _lock:
+        _cache.pop((func.__module__, func.__qualname__, args), None)
+
+
+def is_dir(path):
+    # True or False, raises UnavailableError if the drive isn't responding
+    return call(os.path.isdir, str(path))
+
+
+def is_file(path):
+    return call(os.path.isfile, str(path))
+
+
+def exists(path):
+    return call(os.path.exists, str(path))
@@ -0,0 +1,88 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+import datetime
+import re
+
+from .utils import get_datetime, get_preferences
+
+# flag keywords are removed from the folder name and stored on the folder
+FLAG_KEYWORDS = {
+    "*B": "move_blend",
+    "*M": "bookmark",
+    "*R": "reference",
+    "*O": "render",
+}
+
+# substitution keywords are replaced with a value from the keyword context
+# each keyword maps to a function that takes the context and returns the value
+_substitutions = {}
+_keyword_re = None
+
+
+def register_keyword(keyword, get_value):
+    global _keyword_re
+    _substitutions[keyword] = get_value
+    # longer keywords first, so they aren't split by shorter ones
+    keywords = sorted(_substitutions, key=len, reverse=True)
+    _keyword_re = re.compile("|".join(re.escape(keyword) for keyword in keywords))
+
+
+def get_keywords():
+    return tuple(_substitutions)
+
+
+def compile_template(name):
+    # split the name into text and keywords, keywords are stored as (keyword,)
+    template = []
+    end = 0
+    for match in _keyword_re.finditer(name):
+        if match.start() > end:
+            template.append(name[end : match.start()])
+        template.append((match.group(),))
+        end = match.end()
+    if end < len(name):
+        template.append(name[end:])
+    return tuple(template)
+
+
+def render_template(template, context):
+    parts = []
+    for part in template:
+        if isinstance(part, tuple):
+            part = context.get(part[0])
+        parts.append(part)
+    return "".join(parts)
+
+
+def has_unknown_keyword(name):
+    return "*" in _keyword_re.sub("", name)
+
+
+class KeywordContext:
+    # snapshot of everything keywords can be replaced with
+    # taken once per run, so all folders get the same values
+    def __init__(self, blend_path):
+        self.blend_path = blend_path
+        self.now = datetime.datetime.now()
+        self.prefs = get_preferences()
+        self.values = {}
+
+    def get(self, keyword):
+        value = self.values.get(keyword)
+        if value is None:
+            value = _substitutions[keyword](self)
+            self.values[keyword] = value
+        return value
+
+    def read_all(self):
+        # read every value now, so folder names can be found on another thread
+        for keyword in _substitutions:
+            self.get(keyword)
+
+
+register_keyword("*F", lambda context: context.blend_path.stem)
+register_keyword("*X", lambda context: context.prefs.x_input)
+register_keyword("*Y", lambda context: context.prefs.y_input)
+register_keyword("*Z", lambda context: context.prefs.z_input)
+register_keyword("*D", lambda context: get_datetime(now=context.now))
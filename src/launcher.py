@@ -0,0 +1,156 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+import os
+import queue
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import bpy
+
+# a file opened again within this many seconds is ignored
+DEDUPE_SECONDS = 2.0
+# minimum seconds between starting two programs, so bursts don't flood the system
+LAUNCH_INTERVAL = 0.1
+# seconds an error stays in the status bar
+STATUS_SECONDS = 5.0
+
+_queue = queue.Queue()
+_lock = threading.Lock()
+_worker = None
+# paths waiting in the queue
+_queued = set()
+# path -> time it was last started
+_launched = {}
+# started processes that haven't exited, (path, process, stderr file)
+_running = []
+# errors to show in the status bar
+_failures = []
+
+
+def get_command(path):
+    if sys.platform == "darwin":
+        return ("open", path)
+    return ("xdg-open", path)
+
+
+def launch(path):
+    # start the program that opens a file, without waiting for it
+    if sys.platform == "win32":
+        os.startfile(path)
+    else:
+        # a file instead of a pipe, so a program that writes a lot can't block on it
+        # and programs it started can keep writing after it exits
+        errors = tempfile.TemporaryFile()
+        try:
+            process = subprocess.Popen(
+                get_command(path),
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=errors,
+                # don't close the program when blender closes
+                start_new_session=True,
+            )
+        except BaseException:
+            errors.close()
+            raise
+        _running.append((path, process, errors))
+
+
+def check_running():
+    # remember the programs that failed to open their file
+    for item in _running[:]:
+        path, process, errors = item
+        returncode = process.poll()
+        if returncode is None:
+            continue
+        if returncode != 0:
+            errors.seek(0)
+            error = errors.read().decode(errors="replace").strip()
+            add_failure(path, error or f"exit code {returncode}")
+        errors.close()
+        # removed after the failure is added, so report_failures keeps running
+        _running.remove(item)
+
+
+def add_failure(path, error):
+    with _lock:
+        _failures.append(f"Couldn't open '{os.path.basename(path)}': {error}")
+
+
+def run():
+    # worker thread that starts the programs and waits for them to exit
+    last_launch = 0.0
+    while True:
+        try:
+            path = _queue.get(timeout=0.5 if _running else None)
+        except queue.Empty:
+            check_running()
+            continue
+        wait = last_launch + LAUNCH_INTERVAL - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            launch(path)
+        except OSError as e:
+            add_failure(path, e.strerror or str(e))
+        last_launch = time.monotonic()
+        with _lock:
+            _queued.discard(path)
+        check_running()
+
+
+def open_file(file):
+    # returns right away, the file is opened on the worker thread
+    global _worker
+    path = str(file)
+    now = time.monotonic()
+    with _lock:
+        if (
+            path in _queued
+            or now - _launched.get(path, -DEDUPE_SECONDS) < DEDUPE_SECONDS
+        ):
+            # the file is being opened already
+            return
+        _queued.add(path)
+        if len(_launched) > 100:
+            for old_path, launch_time in list(_launched.items()):
+                if now - launch_time >= DEDUPE_SECONDS:
+                    del _launched[old_path]
+        _launched[path] = now
+        if _worker is None:
+            _worker = threading.Thread(target=run, daemon=True)
+            _worker.start()
+    _queue.put(path)
+    if not bpy.app.timers.is_registered(report_failures):
+        bpy.app.timers.register(report_failures, first_interval=0.5)
+
+
+def report_failures():
+    # timer to show errors from the worker thread in the status bar
+    with _lock:
+        failures = _failures[:]
+        _failures.clear()
+        waiting = bool(_queued) or bool(_running)
+    if failures:
+        text = failures[-1]
+        if len(failures) > 1:
+            text += f" (and {len(failures) - 1} more)"
+        set_status_text(text)
+        if bpy.app.timers.is_registered(clear_status_text):
+            bpy.app.timers.unregister(clear_status_text)
+        bpy.app.timers.register(clear_status_text, first_interval=STATUS_SECONDS)
+    return 0.5 if waiting else None
+
+
+def set_status_text(text):
+    for window in bpy.context.window_manager.windows:
+        window.workspace.status_text_set(text)
+
+
+def clear_status_text():
+    set_status_text(None)
+    return None
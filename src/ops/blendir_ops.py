@@ -1,6 +1,8 @@
 # Copyright (C) 2022 Daniel Boxer
 # See __init__.py and LICENSE for more information
 
+import pathlib
+import time
 import zipfile
 
 import bpy
@@ -8,37 +10,220 @@ from bpy.props import BoolProperty, EnumProperty, IntProperty, StringProperty
 from bpy.types import Operator
 from bpy_extras.io_utils import ExportHelper, ImportHelper
 
-from ..blendir_main import BlenDirError, archive, read_structure
-from ..bookmark import add_bookmark, get_bookmarks
+from .. import filesystem
+from ..archive import (
+    archive,
+    format_size,
+    get_archive_path,
+    measure_sizes,
+    read_index,
+)
+from ..blendir_main import BlenDirError, CreateJob, save_blend
+from ..bookmark import add_bookmark, is_bookmarked
+from ..filesystem import UnavailableError
 from ..recent import add_recent
-from ..structure import import_struct, structs_add_value
+from ..references import fill_reference_items, get_reference_index, get_references
+from ..state import reset_stores, set_panel_category
+from ..structure import check_struct_name, structs_add_value
 from ..utils import (
+    INVALID_CHARS,
     get_active_path,
     get_panel_path,
     get_preferences,
     get_recent_path,
-    get_references,
     get_struct_path,
     open_file,
     reset_props,
-    set_panel_category,
     valid_filename,
     valid_path,
 )
 
+# seconds to wait for the worker when blender cancels creating folders
+CANCEL_TIMEOUT = 5.0
+
+
+class BLENDIR_OT_create_folders(Operator):
+    bl_idname = "blendir.create_folders"
+    bl_label = "Create Folders"
+    bl_description = "Create the folders of the active structure"
+    bl_options = {"INTERNAL"}
+
+    sync: BoolProperty()
+    rename: BoolProperty()
+    # where the blender file is, if it isn't saved there yet
+    blend_path: StringProperty(options={"SKIP_SAVE"})
+    # saves that were left for the one at the end, to report the time saved
+    skipped_saves: IntProperty(options={"SKIP_SAVE"})
+
+    @classmethod
+    def description(cls, context, properties):
+        if properties.rename:
+            return (
+                "Apply the edited structure to the existing folders."
+                " Folders that were renamed or moved in the structure are renamed"
+                " or moved after confirmation"
+                " and missing folders are added"
+            )
+        if properties.sync:
+            return (
+                "Add the folders that are missing from the existing folder structure."
+                " Nothing is moved or archived"
+            )
+        return cls.bl_description
+
+    def invoke(self, context, event):
+        try:
+            self._job = CreateJob(
+                get_active_path(), self.sync, self.rename, self.blend_path
+            )
+        except BlenDirError as e:
+            self.save_pending()
+            self.report({"ERROR"}, str(e))
+            return {"CANCELLED"}
+        # the folders are planned on the worker thread too
+        self._job.start()
+        self._asked = False
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        # the number of folders isn't known until they're planned
+        wm.progress_begin(0, 100)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        job = self._job
+        if event.type == "ESC":
+            job.cancel()
+
+        if event.type == "TIMER":
+            if not job.is_planned():
+                status = "Planning folders"
+            elif job.is_waiting():
+                status = "Waiting for the renames to be confirmed"
+                if not self._asked:
+                    self._asked = True
+                    self.ask_renames()
+            else:
+                progress = job.get_progress()
+                context.window_manager.progress_update(
+                    100 * progress // max(job.new_count, 1)
+                )
+                status = f"Creating folders: {progress} / {job.new_count}"
+            context.workspace.status_text_set(f"{status}. Press Esc to cancel")
+
+            if job.is_done():
+                self.end(context)
+                try:
+                    if not job.finish():
+                        self.save_pending()
+                        self.report({"INFO"}, "Folder creation cancelled")
+                        return {"CANCELLED"}
+                except BlenDirError as e:
+                    # the folders made before the error have been removed already
+                    self.save_pending()
+                    self.report({"ERROR"}, str(e))
+                    return {"CANCELLED"}
+                # save once to store the new location and any changed properties
+                # like project bookmarks
+                save_time = save_blend(job.blend_path)
+                add_recent(bpy.data.filepath)
+                if self.sync:
+                    s = "s" if job.new_count != 1 else ""
+                    message = f"Added {job.new_count} missing folder{s}"
+                    # a folder with the same parent was renamed, others were moved
+                    renamed = sum(
+                        1
+                        for old_path, new_path in job.renames
+                        if old_path.rpartition("/")[0] == new_path.rpartition("/")[0]
+                    )
+                    moved = len(job.renames) - renamed
+                    for count, verb in ((renamed, "renamed"), (moved, "moved")):
+                        if count:
+                            s = "s" if count != 1 else ""
+                            message += f", {verb} {count} folder{s}"
+                else:
+                    message = "Folder structure created"
+                saves = self.skipped_saves + job.moved_blend + 1
+                if saves > 1:
+                    message += (
+                        f". Saved once instead of {saves} times,"
+                        f" the save took {save_time:.1f}s"
+                    )
+                self.report({"INFO"}, message)
+                return {"FINISHED"}
+
+        # let the user keep working while the folders are created
+        return {"PASS_THROUGH"}
+
+    def ask_renames(self):
+        # renaming moves folders with everything in them, so ask first
+        global _confirm_job
+        _confirm_job = self._job
+        bpy.ops.blendir.confirm_renames("INVOKE_DEFAULT")
+
+    def cancel(self, context):
+        # blender cancels the operator, for example when another file is opened
+        job = self._job
+        job.cancel()
+        # the worker stops at the next folder, then the folders are removed
+        job.thread.join(CANCEL_TIMEOUT)
+        if job.is_done():
+            job.finish()
+        self.end(context)
+
+    def save_pending(self):
+        # the blender file was moved or not saved yet, so it has to be saved
+        # even if no folders were created
+        if self.blend_path != "" and self.blend_path != bpy.data.filepath:
+            save_blend(self.blend_path)
+
+    def end(self, context):
+        global _confirm_job
+        if _confirm_job is self._job:
+            _confirm_job = None
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
+
+
+# the job whose renames are shown by confirm_renames
+_confirm_job = None
+
+
+class BLENDIR_OT_confirm_renames(Operator):
+    bl_idname = "blendir.confirm_renames"
+    bl_label = "Rename Folders"
+    bl_description = "Rename and move folders to match the edited structure"
+    bl_options = {"INTERNAL"}
+
+    def invoke(self, context, event):
+        if _confirm_job is None:
+            return {"CANCELLED"}
+        return context.window_manager.invoke_props_dialog(self, width=500)
+
+    def execute(self, context):
+        if _confirm_job is not None:
+            _confirm_job.confirm()
+        return {"FINISHED"}
+
+    def cancel(self, context):
+        # the dialog was closed, nothing has been renamed or created yet
+        if _confirm_job is not None:
+            _confirm_job.cancel()
 
-def create_folders(self):
-    try:
-        read_structure(get_active_path())
-    except BlenDirError as e:
-        archive(bpy.context.scene.blendir_props.old_path)
-        self.report({"ERROR"}, str(e))
-        return {"CANCELLED"}
-    add_recent(bpy.data.filepath)
-    # save to store any changed properties like project bookmarks or reference path
-    bpy.ops.wm.save_mainfile()
-    self.report({"INFO"}, "Folder structure created")
-    return {"FINISHED"}
+    def draw(self, context):
+        renames = _confirm_job.proposed_renames if _confirm_job is not None else []
+        col = self.layout.column()
+        s = "s" if len(renames) != 1 else ""
+        col.label(
+            text=f"Rename or move {len(renames)} folder{s} to match the structure?"
+        )
+        for old_path, new_path in renames[:10]:
+            col.label(text=f"{old_path}  ->  {new_path}", icon="FORWARD")
+        if len(renames) > 10:
+            col.label(text=f"And {len(renames) - 10} more")
 
 
 class BLENDIR_OT_start(Operator):
@@ -59,12 +244,31 @@ class BLENDIR_OT_start(Operator):
         props = context.scene.blendir_props
         if props.old_path != "":
             try:
-                archive(props.old_path)
+                # archiving a folder on a drive that hangs would freeze blender
+                filesystem.is_dir(props.old_path)
+            except UnavailableError:
+                self.report({"ERROR"}, "The project folder isn't responding")
+                return {"CANCELLED"}
+            # moving the blender file out of the old structure used to save it
+            skipped_saves = int(
+                pathlib.Path(bpy.data.filepath).parent
+                != pathlib.Path(props.old_path).parent
+            )
+            try:
+                blend_path = archive(props.old_path)
             except BlenDirError as e:
                 self.report({"ERROR"}, str(e))
                 return {"CANCELLED"}
-
-        return create_folders(self)
+            # the blender file is moved and saved when the folders have been created
+            bpy.ops.blendir.create_folders(
+                "INVOKE_DEFAULT",
+                blend_path=str(blend_path),
+                skipped_saves=skipped_saves,
+            )
+            return {"FINISHED"}
+
+        bpy.ops.blendir.create_folders("INVOKE_DEFAULT")
+        return {"FINISHED"}
 
     def invoke(self, context, event):
         props = context.scene.blendir_props
@@ -97,6 +301,53 @@ class BLENDIR_OT_start(Operator):
         col.label(text="The Blender file will be moved to the correct location.")
 
 
+class BLENDIR_OT_show_archive(Operator):
+    bl_idname = "blendir.show_archive"
+    bl_label = "Archive"
+    bl_description = "Show the archived folder structures of this project"
+
+    def execute(self, context):
+        return {"FINISHED"}
+
+    def invoke(self, context, event):
+        old_path = context.scene.blendir_props.old_path
+        if old_path == "":
+            self.report({"ERROR"}, "The folder structure hasn't been created yet")
+            return {"CANCELLED"}
+        self._archive_path = get_archive_path(old_path)
+        try:
+            # the index is read instead of listing the archive folder
+            # it's read once here, drawing doesn't touch the disk
+            self._entries = read_index(self._archive_path)["entries"]
+        except (OSError, ValueError) as e:
+            self.report({"ERROR"}, f"The archive index couldn't be read: {e}")
+            return {"CANCELLED"}
+        # sizes that weren't measured yet are shown when they're done
+        measure_sizes(self._archive_path)
+        return context.window_manager.invoke_popup(self, width=400)
+
+    def draw(self, context):
+        archive_path = self._archive_path
+        box = self.layout.box()
+        box.label(text="Archived Structures", icon="FILE_FOLDER")
+        entries = self._entries
+        if not entries:
+            box.label(text="Nothing has been archived yet")
+            return
+
+        col = box.column()
+        # newest first
+        for entry in reversed(entries):
+            row = col.row()
+            date = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["time"]))
+            row.label(text=f"{entry['slot']}: {entry['name']}")
+            row.label(text=date)
+            row.label(text=format_size(entry["size"]))
+            row.operator("wm.path_open", text="", icon="FILEBROWSER").filepath = str(
+                archive_path / entry["folder"]
+            )
+
+
 class BLENDIR_OT_save_blend(Operator, ImportHelper):
     bl_idname = "blendir.save_blend"
     bl_label = "Start BlenDir"
@@ -114,11 +365,14 @@ class BLENDIR_OT_save_blend(Operator, ImportHelper):
         if len(new_filepath) == 1:
             self.report({"ERROR"}, f"Invalid file name. Remove '{new_filepath}'")
             return {"CANCELLED"}
-        # save in chosen location
-        bpy.ops.wm.save_as_mainfile(filepath=new_filepath)
         # update the previous save location
         get_preferences().last_path = self.directory
-        return create_folders(self)
+        # the file is saved in the chosen location when the folders have been created
+        # saving here first used to save twice
+        bpy.ops.blendir.create_folders(
+            "INVOKE_DEFAULT", blend_path=new_filepath, skipped_saves=1
+        )
+        return {"FINISHED"}
 
     def invoke(self, context, event):
         # start in previous saved blender file location
@@ -138,7 +392,7 @@ class BLENDIR_OT_save_blend(Operator, ImportHelper):
         box.label(text="1. Choose a save location!", icon="FILE_TICK")
         box.label(text="2. Enter the name of the blend file", icon="SORTALPHA")
         col = box.column()
-        col.label(text="Invalid name characters: [  " + '\/:*?"<>|.' + "  ]")
+        col.label(text="Invalid name characters: [  " + INVALID_CHARS + "  ]")
         col.label(text="Adding '.blend' is not necessary.")
         col.separator()
         col = col.box().column()
@@ -163,18 +417,54 @@ class BLENDIR_OT_directory_browser(Operator, ImportHelper):
         ],
     )
     struct_name: StringProperty()
+    # import options
+    exclude: StringProperty(
+        name="Exclude",
+        description=(
+            "Folders to skip, separated by commas. "
+            "Wildcards are supported (ex. 'Frames/*, blendcache_*')"
+        ),
+    )
+    max_depth: IntProperty(
+        name="Max Depth",
+        description="Deepest level of folders to add. 0 adds all folders",
+        min=0,
+    )
+    symlinks: EnumProperty(
+        name="Links",
+        description="How to handle symbolic links to folders",
+        items=[
+            ("SKIP", "Skip", "Don't add linked folders"),
+            ("LIST", "Add", "Add linked folders without the folders inside them"),
+            ("FOLLOW", "Follow", "Add linked folders and all folders inside them"),
+        ],
+    )
+    max_entries: IntProperty(
+        name="Folder Limit",
+        description="Stop after adding this many folders. 0 adds all folders",
+        min=0,
+    )
 
     def execute(self, context):
         path = self.filepath
         if self.mode == "STRUCTURE":
             try:
-                import_struct(path, bpy.path.basename(path))
+                check_struct_name(bpy.path.basename(path))
             except BlenDirError as e:
                 self.report({"ERROR"}, str(e))
                 return {"CANCELLED"}
-            self.report({"INFO"}, f"Structure '{self.struct_name}' created")
+            # folders are imported in the background
+            bpy.ops.blendir.import_folders(
+                "INVOKE_DEFAULT",
+                path=path,
+                struct_name=bpy.path.basename(path),
+                exclude=self.exclude,
+                max_depth=self.max_depth,
+                symlinks=self.symlinks,
+                max_entries=self.max_entries,
+            )
         else:
-            if path not in get_bookmarks():
+            if not is_bookmarked(path):
                 add_bookmark(path)
                 self.report({"INFO"}, "Folder added to bookmarks")
             else:
@@ -208,6 +498,12 @@ class BLENDIR_OT_directory_browser(Operator, ImportHelper):
                 col.label(text="Unset")
             else:
                 col.label(text=bpy.path.basename(self.filepath))
+            col = box.box().column()
+            col.label(text="Options", icon="PREFERENCES")
+            col.prop(self, "exclude")
+            col.prop(self, "max_depth")
+            col.prop(self, "max_entries")
+            col.prop(self, "symlinks")
         else:
             box.label(text="Choose a directory to bookmark", icon="BOOKMARKS")
             box.label(text="Press 'Start' to add to bookmarks")
@@ -218,11 +514,89 @@ class BLENDIR_OT_open_reference(Operator):
     bl_label = "Reference"
     bl_description = "Open reference file"
 
-    reference_idx: IntProperty()
+    # path relative to the reference folder
+    # instead of an index, the folder can change while the menu is open
+    reference: StringProperty()
+
+    def execute(self, context):
+        try:
+            refs = get_references()
+        except UnavailableError:
+            self.report({"ERROR"}, "The reference folder isn't responding")
+            return {"CANCELLED"}
+        except OSError:
+            self.report({"ERROR"}, "The reference folder doesn't exist")
+            return {"CANCELLED"}
+        path = refs.path / self.reference
+        try:
+            found = filesystem.is_file(path)
+        except UnavailableError:
+            self.report({"ERROR"}, "The reference folder isn't responding")
+            return {"CANCELLED"}
+        if not found:
+            # the file was removed since the folder was last listed
+            get_references(refresh=True)
+            self.report({"ERROR"}, f"Reference '{path.name}' no longer exists")
+            return {"CANCELLED"}
+        open_file(path)
+        return {"FINISHED"}
+
+
+class BLENDIR_OT_reference_browser(Operator):
+    bl_idname = "blendir.reference_browser"
+    bl_label = "References"
+    bl_description = "Search the files in the reference folder and its subfolders"
+
+    def execute(self, context):
+        return {"FINISHED"}
+
+    def invoke(self, context, event):
+        if context.scene.blendir_props.reference_path == "":
+            self.report({"ERROR"}, "There is no reference folder, add one with '*R'")
+            return {"CANCELLED"}
+        try:
+            fill_reference_items(context.window_manager)
+        except UnavailableError:
+            self.report({"ERROR"}, "The reference folder isn't responding")
+            return {"CANCELLED"}
+        except OSError:
+            self.report({"ERROR"}, "The reference folder doesn't exist")
+            return {"CANCELLED"}
+        return context.window_manager.invoke_popup(self, width=500)
+
+    def draw(self, context):
+        wm = context.window_manager
+        row = self.layout.row()
+        row.label(text="References", icon="IMAGE_REFERENCE")
+        row.operator("blendir.refresh_references", text="", icon="FILE_REFRESH")
+        # only the visible rows are drawn, so this stays fast with many files
+        self.layout.template_list(
+            "BLENDIR_UL_references",
+            "",
+            wm,
+            "blendir_references",
+            wm,
+            "blendir_reference_idx",
+            rows=12,
+        )
+
+
+class BLENDIR_OT_refresh_references(Operator):
+    bl_idname = "blendir.refresh_references"
+    bl_label = "Refresh"
+    bl_description = "List the files in the reference folder again"
+    bl_options = {"INTERNAL"}
 
     def execute(self, context):
-        refs = get_references()
-        open_file(refs[1] / refs[0][self.reference_idx])
+        try:
+            get_reference_index(refresh=True)
+            fill_reference_items(context.window_manager)
+        except UnavailableError:
+            self.report({"ERROR"}, "The reference folder isn't responding")
+            return {"CANCELLED"}
+        except OSError:
+            self.report({"ERROR"}, "The reference folder doesn't exist")
+            return {"CANCELLED"}
         return {"FINISHED"}
 
 
@@ -329,6 +703,8 @@ class BLENDIR_OT_import(Operator, ImportHelper):
                     panel_path = get_panel_path()
                     zipf.extract(entry, panel_path.parent)
 
+        # the imported files replace the ones that are in memory
+        reset_stores()
         # sync prefs with new structs
         for struct in get_struct_path().iterdir():
             name = struct.stem.split("blendir_")
@@ -3,13 +3,14 @@
 
 import bpy
 from bpy.types import Operator
-from bpy.props import IntProperty, EnumProperty
+from bpy.props import StringProperty
 from ..blendir_main import BlenDirError
 from ..utils import open_path
-from ..bookmark import get_bookmarks, open_bookmarks
-
-
-_co = [0, 0]
+from ..bookmark import (
+    add_bookmark_use,
+    fill_bookmark_items,
+    open_bookmarks,
+)
 
 
 class BLENDIR_OT_bookmarks(Operator):
@@ -55,17 +56,41 @@ class BLENDIR_OT_open_bookmark(Operator):
     bl_label = "Bookmark"
     bl_description = "Open bookmarked folder"
 
-    bookmark_idx: IntProperty()
+    # the path instead of an index, the bookmarks can change while the menu is open
+    path: StringProperty()
 
     def execute(self, context):
-        bookmarks = []
-        for bookmark in context.scene.blendir_bookmarks:
-            bookmarks.append(bookmark.path)
-        bookmarks += get_bookmarks()
-        open_path(bookmarks[self.bookmark_idx], True)
+        open_path(self.path, True)
+        add_bookmark_use(self.path)
         return {"FINISHED"}
 
 
+class BLENDIR_OT_search_bookmarks(Operator):
+    bl_idname = "blendir.search_bookmarks"
+    bl_label = "Search Bookmarks"
+    bl_description = "Search the project and saved bookmarks"
+
+    def execute(self, context):
+        return {"FINISHED"}
+
+    def invoke(self, context, event):
+        fill_bookmark_items(context)
+        return context.window_manager.invoke_popup(self, width=450)
+
+    def draw(self, context):
+        self.layout.label(text="Bookmarks", icon="BOOKMARKS")
+        # only the visible rows are drawn, so this stays fast with many bookmarks
+        self.layout.template_list(
+            "BLENDIR_UL_bookmarks",
+            "",
+            context.window_manager,
+            "blendir_bookmark_results",
+            context.window_manager,
+            "blendir_bookmark_idx",
+            rows=10,
+        )
+
+
 class BLENDIR_OT_edit_bookmarks(Operator):
     bl_idname = "blendir.edit_bookmarks"
     bl_label = "Edit Bookmarks"
@@ -80,33 +105,6 @@ class BLENDIR_OT_edit_bookmarks(Operator):
         return {"FINISHED"}
 
 
-class BLENDIR_OT_change_page(Operator):
-    bl_idname = "blendir.change_page"
-    bl_label = "Page"
-    bl_description = "Change page"
-
-    mode: EnumProperty(
-        items=[
-            ("NEXT", "0", ""),
-            ("PREVIOUS", "1", ""),
-        ],
-    )
-
-    def execute(self, context):
-        props = context.scene.blendir_props
-        if self.mode == "NEXT":
-            props.bookmark_page += 1
-        else:
-            props.bookmark_page -= 1
-
-        # set mouse position to the position when the menu was opened
-        # this keeps the menu in the same position when changing pages
-        context.window.cursor_warp(_co[0], _co[1])
-
-        bpy.ops.wm.call_menu_pie("INVOKE_DEFAULT", name="BLENDIR_MT_bookmarks_pie")
-        return {"FINISHED"}
-
-
 class BLENDIR_OT_open_bookmarks_pie(Operator):
     bl_idname = "blendir.open_bookmarks_pie"
     bl_label = "Bookmarks"
@@ -114,8 +112,3 @@ class BLENDIR_OT_open_bookmarks_pie(Operator):
     def execute(self, context):
         bpy.ops.wm.call_menu_pie("INVOKE_DEFAULT", name="BLENDIR_MT_bookmarks_pie")
         return {"FINISHED"}
-
-    def invoke(self, context, event):
-        _co[0] = event.mouse_x
-        _co[1] = event.mouse_y
-        return self.execute(context)
@@ -3,8 +3,9 @@
 
 import bpy
 
-from ..recent import get_recent
-from ..utils import get_preferences, get_recent_path, get_references, open_file
+from ..recent import add_recent
+from ..references import get_references
+from ..utils import get_preferences, get_recent_path, open_file
 
 
 class BLENDIR_OT_open_recent(bpy.types.Operator):
@@ -12,22 +13,22 @@ class BLENDIR_OT_open_recent(bpy.types.Operator):
     bl_label = "Open Recent"
     bl_description = "Open recent project"
 
-    recent_idx: bpy.props.IntProperty()
+    # the path instead of an index, the list can change while the menu is open
+    path: bpy.props.StringProperty()
 
     def execute(self, context):
-        bpy.ops.wm.open_mainfile(filepath=get_recent()[self.recent_idx])
+        bpy.ops.wm.open_mainfile(filepath=self.path)
+        # every open counts towards the ranking of the project
+        add_recent(bpy.data.filepath)
         if get_preferences().autoload_refs:
             try:
                 refs = get_references()
-            except FileNotFoundError:
+            except OSError:
                 self.report({"ERROR"}, "Project references could not be loaded")
                 return {"CANCELLED"}
             # open up to 8 references
-            if refs[1] != "":
-                for ref_idx, ref in enumerate(refs[0]):
-                    if ref_idx > 7:
-                        break
-                    open_file(refs[1] / ref)
+            for ref in refs.names[:8]:
+                open_file(refs.path / ref)
         return {"FINISHED"}
 
     def invoke(self, context, event):
@@ -3,9 +3,9 @@
 
 import bpy
 from bpy.types import Operator
-from ..blendir_main import BlenDirError
+from ..blendir_main import BlenDirError, lint_structure, set_lint_results
 from ..utils import get_invalid_char, get_active_path, get_preferences
-from ..structure import open_struct, new_struct, structs_remove_value
+from ..structure import ImportJob, open_struct, new_struct, structs_remove_value
 
 
 class BLENDIR_OT_new_structure(Operator):
@@ -175,3 +175,112 @@ class BLENDIR_OT_import_structure(Operator):
         )
         dir_browser.mode = "STRUCTURE"
         dir_browser.struct_name = self.struct_name
+
+
+class BLENDIR_OT_check_structure(Operator):
+    bl_idname = "blendir.check_structure"
+    bl_label = "Check Structure"
+    bl_description = (
+        "Check the active folder structure for errors without creating folders."
+        " All problems will be shown in the panel"
+    )
+
+    def execute(self, context):
+        struct_name = get_preferences().structure
+        if struct_name == "No structures? Try adding some!":
+            self.report({"ERROR"}, "No structures to check")
+            return {"CANCELLED"}
+
+        structure_path = get_active_path()
+        errors, root_parent = lint_structure(structure_path)
+        set_lint_results(struct_name, structure_path, errors)
+        if root_parent is None:
+            where = "folders not checked, save the file or choose a save location first"
+        else:
+            where = f"folders checked in '{root_parent}'"
+        if errors:
+            s = "s" if len(errors) != 1 else ""
+            self.report({"WARNING"}, f"Found {len(errors)} problem{s} ({where})")
+        else:
+            self.report({"INFO"}, f"No problems found ({where})")
+        return {"FINISHED"}
+
+
+class BLENDIR_OT_import_folders(Operator):
+    bl_idname = "blendir.import_folders"
+    bl_label = "Import Folders"
+    bl_description = "Generate a folder structure file from a directory"
+
+    path: bpy.props.StringProperty()
+    struct_name: bpy.props.StringProperty()
+    exclude: bpy.props.StringProperty()
+    max_depth: bpy.props.IntProperty()
+    symlinks: bpy.props.StringProperty(default="SKIP")
+    max_entries: bpy.props.IntProperty()
+
+    def invoke(self, context, event):
+        exclude = [p.strip() for p in self.exclude.split(",") if p.strip()]
+        self._job = ImportJob(
+            self.path,
+            self.struct_name,
+            exclude,
+            self.max_depth,
+            self.symlinks,
+            self.max_entries,
+        )
+        self._job.start()
+
+        wm = context.window_manager
+        self._timer = wm.event_timer_add(0.1, window=context.window)
+        # the total is only known if there is a folder limit
+        wm.progress_begin(0, self.max_entries or 1000)
+        wm.modal_handler_add(self)
+        return {"RUNNING_MODAL"}
+
+    def modal(self, context, event):
+        job = self._job
+        if event.type == "ESC":
+            job.cancel()
+
+        if event.type == "TIMER":
+            context.window_manager.progress_update(job.count)
+            context.workspace.status_text_set(
+                f"Importing '{self.struct_name}': {job.count} folders."
+                " Press Esc to cancel"
+            )
+
+            if job.is_done():
+                self.end(context)
+                if job.cancelled.is_set():
+                    self.report({"INFO"}, "Import cancelled")
+                    return {"CANCELLED"}
+                if job.error is not None:
+                    self.report({"ERROR"}, f"Import failed: {job.error}")
+                    return {"CANCELLED"}
+                try:
+                    job.finish()
+                except BlenDirError as e:
+                    self.report({"ERROR"}, str(e))
+                    return {"CANCELLED"}
+                if job.limit_reached:
+                    self.report(
+                        {"WARNING"},
+                        f"Structure '{self.struct_name}' created."
+                        f" Only the first {self.max_entries} folders were added",
+                    )
+                else:
+                    self.report({"INFO"}, f"Structure '{self.struct_name}' created")
+                return {"FINISHED"}
+
+        # let the user keep working while the folders are imported
+        return {"PASS_THROUGH"}
+
+    def cancel(self, context):
+        self._job.cancel()
+        self.end(context)
+
+    def end(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
@@ -0,0 +1,228 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+import hashlib
+import os
+import queue
+import threading
+
+import bpy
+import bpy.utils.previews
+
+from .utils import get_extension_dir_path
+
+THUMBNAIL_SIZE = 128
+# the oldest thumbnails are removed when the cache is bigger than this
+CACHE_LIMIT = 64 * 1024 * 1024
+PREVIEW_THREADS = 2
+IMAGE_EXTENSIONS = {
+    ".bmp",
+    ".exr",
+    ".hdr",
+    ".jpeg",
+    ".jpg",
+    ".png",
+    ".tga",
+    ".tif",
+    ".tiff",
+    ".webp",
+}
+
+_collection = None
+_cache_path = None
+# (path, cache path) of the thumbnails to make
+_queue = queue.Queue()
+# daemon threads, so a file on a drive that hangs can't keep blender from closing
+_workers = []
+# size of the thumbnails in the cache, the cache is only listed when it's unknown
+_cache_size = None
+# the reference snapshot the icons are for
+_snapshot = None
+# path -> icon id, 0 if the file has no thumbnail
+_icons = {}
+# paths that have a thumbnail being made
+_pending = set()
+# (path, thumbnail path) pairs that are ready to load on the main thread
+_ready = []
+_lock = threading.Lock()
+
+
+def get_cache_key(path, stat):
+    # a new version of the file gets a new thumbnail
+    key = f"{path}|{stat.st_mtime_ns}|{stat.st_size}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def make_thumbnail(src, dst):
+    import imbuf
+
+    image = imbuf.load(str(src))
+    try:
+        width, height = image.size
+        scale = THUMBNAIL_SIZE / max(width, height, 1)
+        if scale < 1:
+            image.resize(
+                (max(int(width * scale), 1), max(int(height * scale), 1)),
+                method="BILINEAR",
+            )
+        if hasattr(image, "file_format"):
+            image.file_format = "PNG"
+        # write to a temporary name, so a partial thumbnail is never loaded
+        tmp_path = dst.with_name(dst.name + ".tmp")
+        try:
+            imbuf.write(image, filepath=str(tmp_path))
+            os.replace(tmp_path, dst)
+        except BaseException:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+    finally:
+        image.free()
+
+
+def trim_cache(cache_path):
+    # remove the least recently used thumbnails, see get_thumbnail
+    # returns the size of the thumbnails that are left
+    entries = []
+    total = 0
+    with os.scandir(cache_path) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(".png"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+    entries.sort()
+    for _, size, path in entries:
+        if total <= CACHE_LIMIT:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+    return total
+
+
+def add_cache_size(cache_path, size):
+    # the running size is kept, so the cache is only listed when it's too big
+    global _cache_size
+    with _lock:
+        if _cache_size is not None:
+            _cache_size += size
+            if _cache_size <= CACHE_LIMIT:
+                return
+    total = trim_cache(cache_path)
+    with _lock:
+        _cache_size = total
+
+
+def get_thumbnail(path, cache_path):
+    # runs on a worker thread, returns the thumbnail path or None
+    cache_path.mkdir(exist_ok=True)
+    stat = path.stat()
+    thumb_path = cache_path / (get_cache_key(path, stat) + ".png")
+    if thumb_path.is_file():
+        # mark the thumbnail as recently used
+        os.utime(thumb_path)
+        return thumb_path
+    make_thumbnail(path, thumb_path)
+    add_cache_size(cache_path, thumb_path.stat().st_size)
+    return thumb_path
+
+
+def generate(path, cache_path):
+    try:
+        thumb_path = get_thumbnail(path, cache_path)
+    except Exception:
+        # the file can't be read as an image, so it keeps the default icon
+        thumb_path = None
+    with _lock:
+        _pending.discard(path)
+        _ready.append((path, thumb_path))
+
+
+def work():
+    while True:
+        generate(*_queue.get())
+
+
+def load_ready():
+    # timer to load finished thumbnails into the preview collection
+    # blender data can only be changed on the main thread
+    with _lock:
+        ready = _ready[:]
+        _ready.clear()
+        waiting = bool(_pending)
+    if _collection is None:
+        return None
+    for path, thumb_path in ready:
+        if thumb_path is None:
+            _icons[path] = 0
+            continue
+        key = thumb_path.stem
+        preview = _collection.get(key)
+        if preview is None:
+            preview = _collection.load(key, str(thumb_path), "IMAGE")
+        _icons[path] = preview.icon_id
+
+    if ready:
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                area.tag_redraw()
+    return 0.1 if waiting else None
+
+
+def get_icon(refs, name):
+    # returns the thumbnail icon id of a reference, or 0 if it isn't ready
+    # this doesn't touch the disk, the thumbnail is made in the background
+    global _snapshot
+    if refs is not _snapshot:
+        # the folder changed, so check the files again
+        # unchanged files still use the thumbnails in the cache
+        _icons.clear()
+        _snapshot = refs
+    path = refs.path / name
+    icon_id = _icons.get(path)
+    if icon_id is not None:
+        return icon_id
+    if _collection is None or path.suffix.lower() not in IMAGE_EXTENSIONS:
+        return 0
+    with _lock:
+        if path in _pending:
+            return 0
+        _pending.add(path)
+    _queue.put((path, _cache_path))
+    if len(_workers) < PREVIEW_THREADS:
+        worker = threading.Thread(target=work, daemon=True)
+        worker.start()
+        _workers.append(worker)
+    if not bpy.app.timers.is_registered(load_ready):
+        bpy.app.timers.register(load_ready, first_interval=0.1)
+    return 0
+
+
+def register_previews():
+    global _collection, _cache_path
+    _collection = bpy.utils.previews.new()
+    _cache_path = get_extension_dir_path() / "thumbnails"
+
+
+def unregister_previews():
+    global _collection, _snapshot
+    # thumbnails that are being made are still finished and cached
+    if bpy.app.timers.is_registered(load_ready):
+        bpy.app.timers.unregister(load_ready)
+    if _collection is not None:
+        bpy.utils.previews.remove(_collection)
+        _collection = None
+    _snapshot = None
+    _icons.clear()
+    with _lock:
+        _pending.clear()
+        _ready.clear()
+    # the workers stay idle until the add-on is enabled again
+    while True:
+        try:
+            _queue.get_nowait()
+        except queue.Empty:
+            break
@@ -1,29 +1,201 @@
 # Copyright (C) 2022 Daniel Boxer
 # See __init__.py and LICENSE for more information
 
-from .utils import get_recent_path
+import os
+import threading
+import time
+
+import bpy
+
+from . import state
+
+# recent.txt is a log, one line is added every time a project is opened
+# "time<tab>path" is an open, "time<tab>score<tab>path" is a compacted project
+# a line with only a path is from older versions
+
+# the pie shows this many projects
+MAX_RECENT = 8
+# projects kept when the log is compacted
+MAX_HISTORY = 50
+# the log is compacted when it has more lines than this
+COMPACT_LINES = 200
+# an open counts half as much after this many seconds
+HALF_LIFE = 7 * 24 * 60 * 60
+# seconds between checks for projects that no longer exist
+PRUNE_INTERVAL = 5 * 60
+
+
+def decay(seconds):
+    return 0.5 ** (max(seconds, 0) / HALF_LIFE)
+
+
+class Project:
+    def __init__(self, path):
+        self.path = path
+        self.score = 0.0
+        self.time = 0.0
+
+    def add(self, score, when):
+        # the score decays over time, so recent opens count more than old ones
+        if when >= self.time:
+            self.score = self.score * decay(when - self.time) + score
+            self.time = when
+        else:
+            self.score += score * decay(self.time - when)
+
+    def get_rank(self, now):
+        # ties, like projects from older versions, are sorted by time
+        return (self.score * decay(now - self.time), self.time)
+
+
+class History:
+    # projects ranked by how often and how recently they were opened
+    def __init__(self):
+        self.projects = {}
+        # the store version the projects were read from
+        self.version = None
+        self._ranked = None
+
+    def add(self, path, score, when):
+        key = get_key(path)
+        project = self.projects.get(key)
+        if project is None:
+            project = self.projects[key] = Project(path)
+        project.add(score, when)
+        self._ranked = None
+
+    def remove(self, paths):
+        for path in paths:
+            self.projects.pop(get_key(path), None)
+        self._ranked = None
+
+    def load(self, lines):
+        self.projects.clear()
+        for line_idx, line in enumerate(lines):
+            score, when, path = parse_line(line, line_idx)
+            self.add(path, score, when)
+
+    def get_ranked(self):
+        if self._ranked is None:
+            now = time.time()
+            projects = sorted(
+                self.projects.values(),
+                key=lambda project: project.get_rank(now),
+                reverse=True,
+            )
+            self._ranked = [project.path for project in projects]
+        return self._ranked
+
+
+_history = History()
+_prune_lock = threading.Lock()
+_last_prune = None
+_pruning = False
+# projects found missing by the prune thread, removed on the main thread
+_missing = []
+# projects that have been removed, but are still in the log
+_pruned = set()
+
+
+def get_key(path):
+    # the same project can be opened with different paths on some systems
+    return os.path.normcase(os.path.normpath(path))
+
+
+def parse_line(line, line_idx):
+    # returns (score, time, path)
+    parts = line.split("\t")
+    try:
+        if len(parts) == 2:
+            return (1.0, float(parts[0]), parts[1])
+        if len(parts) == 3:
+            return (float(parts[1]), float(parts[0]), parts[2])
+    except ValueError:
+        pass
+    # from older versions, the order of the lines is the only time there is
+    return (1.0, float(line_idx), line)
+
+
+def get_history():
+    # the history is read again if recent.txt was changed outside of this module
+    lines = state.recent.get()
+    if _history.version != state.recent.version:
+        _history.load(lines)
+        _history.version = state.recent.version
+    return _history
 
 
 def add_recent(project_path):
-    path = get_recent_path()
-    recent_projects = get_recent()
-    if len(recent_projects) > 7:
-        recent_projects.append(project_path)
-        with path.open("w") as f:
-            for line in recent_projects[1:]:
-                f.write(line + "\n")
-    else:
-        with path.open("a") as f:
-            f.write(str(project_path) + "\n")
+    # resolve links, so the same project is only in the history once
+    path = os.path.realpath(project_path)
+    now = time.time()
+    history = get_history()
+    version = state.recent.version
+    # adding one line to the log, instead of rewriting it
+    state.recent.add(f"{now:.0f}\t{path}")
+    if state.recent.version == version + 1:
+        history.add(path, 1.0, now)
+        history.version = state.recent.version
+    # otherwise the file was changed by something else, so it's read again
+    if len(state.recent.get()) > COMPACT_LINES:
+        compact()
+
+
+def compact():
+    # replace the log with one line for each of the highest ranked projects
+    # the log is read again first, so opens from other instances are kept
+    def get_lines(lines):
+        _history.load(lines)
+        _history.remove(_pruned)
+        compacted = []
+        for path in _history.get_ranked()[:MAX_HISTORY]:
+            project = _history.projects[get_key(path)]
+            compacted.append(f"{project.time:.0f}\t{project.score:.6g}\t{project.path}")
+        return compacted
+
+    state.recent.update(get_lines)
+    _pruned.clear()
+    _history.load(state.recent.get())
+    _history.version = state.recent.version
+    return None
 
 
 def get_recent():
-    path = get_recent_path()
-    recent_projects = []
-    if path.is_file():
-        with path.open() as f:
-            for line in f:
-                line = line.strip()
-                if line != "":
-                    recent_projects.append(line)
-    return recent_projects
+    # the highest ranked projects, served from memory
+    history = get_history()
+    with _prune_lock:
+        missing = _missing[:]
+        _missing.clear()
+    if missing:
+        history.remove(missing)
+        _pruned.update(missing)
+        # write the log later, this can be called while drawing
+        if not bpy.app.timers.is_registered(compact):
+            bpy.app.timers.register(compact, first_interval=0.1)
+    ranked = history.get_ranked()
+    start_prune(ranked[:MAX_HISTORY])
+    return ranked[:MAX_RECENT]
+
+
+def start_prune(paths):
+    # look for deleted projects on a worker thread, at most every PRUNE_INTERVAL
+    global _last_prune, _pruning
+    now = time.monotonic()
+    with _prune_lock:
+        if _pruning or (_last_prune is not None and now - _last_prune < PRUNE_INTERVAL):
+            return
+        _pruning = True
+        _last_prune = now
+    threading.Thread(target=prune, args=(paths,), daemon=True).start()
+
+
+def prune(paths):
+    global _pruning
+    missing = []
+    for path in paths:
+        # if the folder is gone too, the drive might just not be connected
+        if not os.path.isfile(path) and os.path.isdir(os.path.dirname(path)):
+            missing.append(path)
+    with _prune_lock:
+        _missing.extend(missing)
+        _pruning = False
@@ -0,0 +1,237 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+import os
+import pathlib
+
+import bpy
+
+from . import filesystem
+from .filesystem import UnavailableError
+
+# seconds between checks for changes in the reference folder
+REFRESH_INTERVAL = 2.0
+# seconds the refresh timer waits for the reference folder
+REFRESH_TIMEOUT = 0.05
+# seconds the browser waits for the reference folder and its subfolders to be listed
+BROWSER_TIMEOUT = 1.0
+
+
+class ReferenceSnapshot:
+    # the files in the reference folder when it was last listed
+    # the pie and the operators use the same snapshot, so indices stay valid
+    def __init__(self, path, mtime_ns, names):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.names = names
+
+
+_empty = ReferenceSnapshot("", None, ())
+_snapshot = _empty
+
+
+def get_mtime_ns(path):
+    return os.stat(path).st_mtime_ns
+
+
+def scan_references(ref_path):
+    # the folder is checked before listing, a change while listing is found next time
+    mtime_ns = os.stat(ref_path).st_mtime_ns
+    names = []
+    with os.scandir(ref_path) as entries:
+        for entry in entries:
+            # the entry type comes from the listing on most systems, so this doesn't stat
+            if entry.is_file():
+                names.append(entry.name)
+    names.sort(key=str.lower)
+    return ReferenceSnapshot(pathlib.Path(ref_path), mtime_ns, tuple(names))
+
+
+def get_references(refresh=False):
+    # raises UnavailableError if the reference folder isn't responding
+    global _snapshot
+    ref_path = bpy.context.scene.blendir_props.reference_path
+    if ref_path == "":
+        return _empty
+    # the folder is only listed when the reference path changes
+    # changes in the folder are found by refresh_references
+    if refresh or _snapshot.path != pathlib.Path(ref_path):
+        if refresh:
+            filesystem.forget(scan_references, ref_path)
+        _snapshot = filesystem.call(scan_references, ref_path, ttl=REFRESH_INTERVAL * 2)
+    return _snapshot
+
+
+def refresh_references():
+    # timer to update the snapshot when files are added or removed
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot.path != "":
+        ref_path = str(snapshot.path)
+        try:
+            mtime_ns = filesystem.call(
+                get_mtime_ns, ref_path, timeout=REFRESH_TIMEOUT, ttl=0
+            )
+            if mtime_ns != snapshot.mtime_ns:
+                # a slow listing is finished in the background and used next time
+                _snapshot = filesystem.call(
+                    scan_references,
+                    ref_path,
+                    timeout=REFRESH_TIMEOUT,
+                    ttl=REFRESH_INTERVAL * 2,
+                )
+        except UnavailableError:
+            # keep the old snapshot until the folder responds
+            pass
+        except OSError:
+            # list again when it's needed, so the error is shown then
+            _snapshot = _empty
+    return REFRESH_INTERVAL
+
+
+def register_refresh():
+    if not bpy.app.timers.is_registered(refresh_references):
+        bpy.app.timers.register(
+            refresh_references, first_interval=REFRESH_INTERVAL, persistent=True
+        )
+
+
+def unregister_refresh():
+    if bpy.app.timers.is_registered(refresh_references):
+        bpy.app.timers.unregister(refresh_references)
+
+
+# the browser stops listing subfolders after this many files
+MAX_INDEX_FILES = 10000
+
+
+class BLENDIR_PG_reference(bpy.types.PropertyGroup):
+    # path relative to the reference folder, the name is the file name
+    path: bpy.props.StringProperty()
+
+
+def scan_reference_tree(ref_path):
+    # relative paths of the files in the reference folder and its subfolders
+    files = []
+    stack = [""]
+    while stack and len(files) < MAX_INDEX_FILES:
+        rel_folder = stack.pop()
+        folder = os.path.join(ref_path, rel_folder)
+        try:
+            with os.scandir(folder) as entries:
+                entries = sorted(entries, key=lambda entry: entry.name.lower())
+        except OSError:
+            # skip folders that can't be read
+            continue
+        subfolders = []
+        for entry in entries:
+            rel_path = rel_folder + entry.name
+            if entry.is_file():
+                files.append(rel_path)
+            elif entry.is_dir(follow_symlinks=False):
+                subfolders.append(rel_path + "/")
+        # reversed, so the subfolders are listed in order
+        stack.extend(reversed(subfolders))
+    return files[:MAX_INDEX_FILES]
+
+
+class ReferenceIndex:
+    # search index over the files of the reference browser
+    def __init__(self, snapshot, files, generation):
+        self.snapshot = snapshot
+        self.files = files
+        # stored with the browser list, so a list filled from another index is found
+        self.generation = generation
+        self._paths = [path.lower() for path in files]
+        # extension -> indices of the files
+        self._extensions = {}
+        for idx, path in enumerate(self._paths):
+            name = path.rsplit("/", 1)[-1]
+            if "." in name:
+                extension = name[name.rindex(".") :]
+                self._extensions.setdefault(extension, []).append(idx)
+        self._last_query = ""
+        self._last_result = range(len(files))
+        self._flags_query = None
+        self._flags = []
+
+    def search(self, query):
+        # returns the indices of the files that match every word in the query
+        # ".png" matches extensions and "folder/" matches the files in a subfolder
+        query = query.lower()
+        if query == self._last_query:
+            return self._last_result
+        if query.startswith(self._last_query):
+            # while typing, only the previous results can match
+            result = self._last_result
+        else:
+            result = range(len(self.files))
+        for term in query.split():
+            if term.startswith("."):
+                matches = set()
+                for extension, indices in self._extensions.items():
+                    if extension.startswith(term):
+                        matches.update(indices)
+                result = [idx for idx in result if idx in matches]
+            else:
+                paths = self._paths
+                result = [idx for idx in result if term in paths[idx]]
+        self._last_query = query
+        self._last_result = result
+        return result
+
+    def get_flags(self, query, flag):
+        # filter flags for a UIList, only made again when the query changes
+        if query != self._flags_query:
+            self._flags = [0] * len(self.files)
+            for idx in self.search(query):
+                self._flags[idx] = flag
+            self._flags_query = query
+        return self._flags
+
+
+_index = None
+# counts the indices that were built
+_generation = 0
+
+
+def get_reference_index(refresh=False):
+    # the index is built again when the reference snapshot changes
+    global _index, _generation
+    snapshot = get_references(refresh)
+    if refresh or _index is None or _index.snapshot is not snapshot:
+        files = []
+        if snapshot.path != "":
+            if refresh:
+                filesystem.forget(scan_reference_tree, snapshot.path)
+            # a slow listing is cached when it's done, so opening again uses it
+            files = filesystem.call(
+                scan_reference_tree, snapshot.path, timeout=BROWSER_TIMEOUT, ttl=60
+            )
+        _generation += 1
+        _index = ReferenceIndex(snapshot, files, _generation)
+    return _index
+
+
+_filled_index = None
+
+
+def fill_reference_items(window_manager):
+    # copy the indexed files to the collection the browser list is drawn from
+    global _filled_index
+    index = get_reference_index()
+    if window_manager.blendir_references_generation == index.generation:
+        return
+    items = window_manager.blendir_references
+    items.clear()
+    for path in index.files:
+        item = items.add()
+        item.name = path.rsplit("/", 1)[-1]
+        item.path = path
+    window_manager.blendir_references_generation = index.generation
+    _filled_index = index
+
+
+def get_filled_index():
+    # the index the browser list was filled from, drawing doesn't list the folder again
+    return _filled_index
@@ -0,0 +1,236 @@
+# Copyright (C) 2022 Daniel Boxer
+# See __init__.py and LICENSE for more information
+
+import contextlib
+import os
+import tempfile
+import time
+
+import bpy
+
+try:
+    import fcntl
+except ImportError:
+    # windows
+    fcntl = None
+    import msvcrt
+
+from .utils import (
+    get_bookmark_path,
+    get_bookmark_usage_path,
+    get_panel_path,
+    get_recent_path,
+)
+
+# seconds between checks for changes made outside of this blender instance
+CHECK_INTERVAL = 2.0
+DEFAULT_PANEL = "BlenDir"
+# on windows a file can't be replaced while another process is reading it
+REPLACE_ATTEMPTS = 20
+REPLACE_WAIT = 0.05
+
+
+def get_stamp(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+@contextlib.contextmanager
+def lock_file(path):
+    # other blender instances use the same files, so writes are locked
+    # the lock is on a separate file, because writing replaces the file itself
+    # reading isn't locked, files are replaced or appended to so they are never partial
+    lock_path = path.with_name(path.name + ".lock")
+    with lock_path.open("a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_windows(f)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def lock_windows(f):
+    # every instance locks the first byte, it doesn't have to exist
+    f.seek(0)
+    while True:
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            # LK_LOCK gives up after 10 seconds, keep waiting like flock does
+            continue
+
+
+def replace_file(src, dst):
+    for attempt in range(REPLACE_ATTEMPTS):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == REPLACE_ATTEMPTS - 1:
+                raise
+            time.sleep(REPLACE_WAIT)
+
+
+def write_lines(path, lines):
+    # write to a temporary file and rename, so the file is never partly written
+    # the name is unique, so a write that isn't locked can't use the same file
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=path.name + ".", suffix=".tmp", dir=str(path.parent)
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            for line in lines:
+                f.write(line + "\n")
+        replace_file(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+
+
+class TextStore:
+    # the lines of a text file, read once and kept in memory
+    # changes made outside of the store are found by check_stores
+    # if unique is set, duplicate lines from other instances are removed when reading
+    def __init__(self, get_path, unique=False):
+        self.get_path = get_path
+        self.unique = unique
+        self._path = None
+        self._lines = None
+        self._members = set()
+        self._stamp = None
+        # changes every time the lines change, so derived data can be rebuilt
+        self.version = 0
+
+    @property
+    def path(self):
+        # the extension folder is only looked up once
+        if self._path is None:
+            self._path = self.get_path()
+        return self._path
+
+    def load(self):
+        # the stamp is taken first, so a change while reading is found next check
+        self._stamp = get_stamp(self.path)
+        lines = []
+        if self._stamp is not None:
+            with self.path.open() as f:
+                for line in f:
+                    line = line.strip()
+                    if line != "":
+                        lines.append(line)
+        if self.unique:
+            lines = list(dict.fromkeys(lines))
+        self._lines = lines
+        self._members = set(lines)
+        self.version += 1
+
+    def get(self):
+        # the list is shared, so it must not be changed by the caller
+        if self._lines is None:
+            self.load()
+        return self._lines
+
+    def __contains__(self, line):
+        self.get()
+        return line in self._members
+
+    def set(self, lines):
+        with lock_file(self.path):
+            self._write(lines)
+
+    def update(self, get_lines):
+        # replace the lines with get_lines(current lines)
+        # the file is read again while locked, so lines added by others aren't lost
+        with lock_file(self.path):
+            self.load()
+            self._write(get_lines(self._lines))
+
+    def _write(self, lines):
+        lines = list(lines)
+        write_lines(self.path, lines)
+        self._lines = lines
+        self._members = set(lines)
+        self._stamp = get_stamp(self.path)
+        self.version += 1
+
+    def add(self, line):
+        # append one line to the end of the file instead of writing the whole file
+        self.get()
+        with lock_file(self.path):
+            # find other changes first, the stamp is updated after appending
+            self.check()
+            if self.unique and line in self._members:
+                return
+            with self.path.open("a") as f:
+                f.write(line + "\n")
+            self._lines.append(line)
+            self._members.add(line)
+            self._stamp = get_stamp(self.path)
+            self.version += 1
+
+    def check(self):
+        # read the file again if it was changed, for example in a text editor
+        if self._lines is not None and get_stamp(self.path) != self._stamp:
+            self.load()
+
+    def reset(self):
+        # read the file the next time it's needed
+        self._lines = None
+
+
+bookmarks = TextStore(get_bookmark_path, unique=True)
+recent = TextStore(get_recent_path)
+panel = TextStore(get_panel_path)
+# "count<tab>path" for every bookmark that has been opened
+bookmark_usage = TextStore(get_bookmark_usage_path)
+stores = (bookmarks, recent, panel, bookmark_usage)
+
+
+def check_stores():
+    for store in stores:
+        try:
+            store.check()
+        except OSError:
+            store.reset()
+    return CHECK_INTERVAL
+
+
+def reset_stores():
+    for store in stores:
+        store.reset()
+
+
+def get_panel_category():
+    lines = panel.get()
+    if not lines:
+        return DEFAULT_PANEL
+    return lines[0]
+
+
+def set_panel_category(location):
+    panel.set([location])
+
+
+def register_state():
+    if not bpy.app.timers.is_registered(check_stores):
+        bpy.app.timers.register(
+            check_stores, first_interval=CHECK_INTERVAL, persistent=True
+        )
+
+
+def unregister_state():
+    if bpy.app.timers.is_registered(check_stores):
+        bpy.app.timers.unregister(check_stores)
+    reset_stores()
@@ -1,10 +1,13 @@
 # Copyright (C) 2022 Daniel Boxer
 # See __init__.py and LICENSE for more information
 
-import pathlib
+import fnmatch
 import os
+import pathlib
 import shutil
-from .blendir_main import BlenDirError
+import threading
+
+from .blendir_main import BlenDirError, lint_results
 from .utils import (
     get_preferences,
     get_invalid_char,
@@ -69,6 +72,11 @@ def update_structs(scene, context):
     return items
 
 
+def clear_lint_results(self, context):
+    # selecting a structure again hides its old check results
+    lint_results.pop(self.structure, None)
+
+
 def structs_add_value(value):
     # add to the structure enum
     prefs = get_preferences()
@@ -94,7 +102,95 @@ def structs_remove_value(value):
         raise BlenDirError("No structures to remove")
 
 
-def import_struct(path, struct_name):
+def is_excluded(name, rel_path, exclude):
+    for pattern in exclude:
+        if "/" not in pattern:
+            if fnmatch.fnmatch(name, pattern):
+                return True
+        # patterns with a folder can match at any depth
+        elif fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(
+            rel_path, "*/" + pattern
+        ):
+            return True
+    return False
+
+
+def walk_folders(root, exclude=(), max_depth=0, symlinks="SKIP"):
+    # yield (depth, name) of the root folder and every folder inside, parents first
+    # folders are listed one at a time, so memory use doesn't grow with the tree
+    # exclude is a list of glob patterns matched against the path from the root
+    # max_depth of 0 means there is no limit
+    # symlinks can be "SKIP", "LIST" (add but don't go inside) or "FOLLOW"
+    root = os.fspath(root)
+    # folders that have been entered, to avoid symlink loops
+    visited = set()
+    if symlinks == "FOLLOW":
+        try:
+            stat = os.stat(root)
+            visited.add((stat.st_dev, stat.st_ino))
+        except OSError:
+            # the root can't be read, so nothing is listed inside it anyway
+            pass
+
+    # stack of (name, path, relative path, depth) of the folders to visit
+    # path is None if the folder shouldn't be entered
+    stack = [(os.path.basename(root), root, "", 0)]
+    while stack:
+        name, path, rel_path, depth = stack.pop()
+        yield depth, name
+        if path is None or (max_depth and depth >= max_depth):
+            continue
+
+        folders = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        is_link = entry.is_symlink()
+                        if is_link and symlinks == "SKIP":
+                            continue
+                        if not entry.is_dir():
+                            continue
+                    except OSError:
+                        # skip entries that can't be checked, like a broken link
+                        continue
+                    entry_rel_path = (
+                        f"{rel_path}/{entry.name}" if rel_path else entry.name
+                    )
+                    if is_excluded(entry.name, entry_rel_path, exclude):
+                        continue
+                    if is_link and symlinks == "LIST":
+                        entry_path = None
+                    else:
+                        entry_path = entry.path
+                    folders.append((entry.name, entry_path, entry_rel_path))
+        except OSError:
+            # skip folders that can't be read, or the rest of them on a read error
+            pass
+
+        folders.sort()
+        if symlinks == "FOLLOW":
+            for folder_idx, (name, entry_path, entry_rel_path) in enumerate(folders):
+                try:
+                    stat = os.stat(entry_path)
+                except OSError:
+                    # list the folder but don't enter it
+                    folders[folder_idx] = (name, None, entry_rel_path)
+                    continue
+                key = (stat.st_dev, stat.st_ino)
+                if key in visited:
+                    # list the folder but don't enter it again
+                    folders[folder_idx] = (name, None, entry_rel_path)
+                else:
+                    visited.add(key)
+        # reversed, so the first folder is visited first
+        stack.extend(
+            (name, entry_path, entry_rel_path, depth + 1)
+            for name, entry_path, entry_rel_path in reversed(folders)
+        )
+
+
+def check_struct_name(struct_name):
     if struct_name == "":
         raise BlenDirError("The structure name can't be blank")
     invalid = get_invalid_char(struct_name)
@@ -103,37 +199,97 @@ def import_struct(path, struct_name):
     if get_active_path(struct_name).is_file():
         raise BlenDirError(f"Structure '{struct_name}' already exists")
 
-    with get_active_path(struct_name).open("w") as f:
+
+class ImportJob:
+    # writes a structure file from a directory on a worker thread
+    # the file is only added once all folders have been written
+    def __init__(
+        self, path, struct_name, exclude=(), max_depth=0, symlinks="SKIP", max_entries=0
+    ):
         # remove structure name from path
-        path = pathlib.Path(path).parent
-        initial_depth = len(path.parents)
-        # travel through all folders
-        for dir in os.walk(path):
-            dir_path = pathlib.Path(dir[0])
-            new_depth = len(dir_path.parents)
-            # the depth is the amount of tabs the folder should have
-            curr_depth = new_depth - initial_depth
-            f.write("\t" * curr_depth + dir_path.stem + "\n")
-
-        # add keyword information
-        template_path = get_struct_path() / "new.txt"
-        if template_path.is_file():
-            f.write("\n")
-            f.write("\n")
-            with template_path.open("r") as template:
-                # skip the example structure
-                for line in template:
-                    if "Keywords (case sensitive)" in line:
-                        f.write(line)
+        self.path = pathlib.Path(path).parent
+        self.struct_name = struct_name
+        self.dst = get_active_path(struct_name)
+        self.template_path = get_struct_path() / "new.txt"
+        self.exclude = exclude
+        self.max_depth = max_depth
+        self.symlinks = symlinks
+        self.max_entries = max_entries
+
+        self.count = 0
+        self.limit_reached = False
+        self.error = None
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def is_done(self):
+        return not self.thread.is_alive()
+
+    def run(self):
+        tmp_path = self.dst.with_name(self.dst.name + ".tmp")
+        try:
+            with tmp_path.open("w") as f:
+                # travel through all folders
+                folders = walk_folders(
+                    self.path, self.exclude, self.max_depth, self.symlinks
+                )
+                for depth, name in folders:
+                    if self.cancelled.is_set():
                         break
-                    else:
-                        template.readline()
-                # write keyword information
-                for line in template:
-                    f.write(line)
+                    if self.max_entries and self.count >= self.max_entries:
+                        self.limit_reached = True
+                        break
+                    # the depth is the amount of tabs the folder should have
+                    f.write("\t" * depth + pathlib.PurePath(name).stem + "\n")
+                    self.count += 1
+
+                write_keyword_info(f, self.template_path)
+
+            if self.cancelled.is_set():
+                tmp_path.unlink()
+            else:
+                # replace in one step, so a partial file is never seen
+                os.replace(tmp_path, self.dst)
+        except Exception as e:
+            # any error is stored, like a name that can't be encoded on windows
+            # otherwise the thread would end without an error and finish would run
+            self.error = e
+            try:
+                if tmp_path.is_file():
+                    tmp_path.unlink()
+            except OSError:
+                pass
 
-    structs_add_value(struct_name)
-    open_struct(get_active_path())
+    def finish(self):
+        # this has to run on the main thread
+        if not self.dst.is_file():
+            raise BlenDirError(f"Structure '{self.struct_name}' wasn't written")
+        structs_add_value(self.struct_name)
+        open_struct(self.dst)
+
+
+def write_keyword_info(f, template_path):
+    # add keyword information
+    if template_path.is_file():
+        f.write("\n")
+        f.write("\n")
+        with template_path.open("r") as template:
+            # skip the example structure
+            for line in template:
+                if "Keywords (case sensitive)" in line:
+                    f.write(line)
+                    break
+                else:
+                    template.readline()
+            # write keyword information
+            for line in template:
+                f.write(line)
 
 
 def structs_add_empty():
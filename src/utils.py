@@ -1,34 +1,73 @@
 # Copyright (C) 2022 Daniel Boxer
 # See __init__.py and LICENSE for more information
 
+import bisect
 import datetime
+import errno
+import itertools
 import os
 import pathlib
+import re
 import shutil
-import subprocess
-import sys
 
 import bpy
 
+from . import filesystem, launcher
+from .filesystem import UnavailableError
+
+INVALID_CHARS = '\\/:*?"<>|.'
+
+
+def _invalid_pattern(invalid):
+    # comment lines are matched without a group so they can be skipped
+    return re.compile(r"^[^\S\n]*//[^\n]*|([" + re.escape(invalid) + "])", re.MULTILINE)
+
+
+_invalid_re = re.compile("[" + re.escape(INVALID_CHARS) + "]")
+_invalid_keywords_re = _invalid_pattern(INVALID_CHARS.replace("*", ""))
+
 
 def get_invalid_char(line, skip_keywords=False):
-    invalid = '\/:*?"<>|.'
     if skip_keywords:
         if line.strip().startswith("//"):
             return None
-        invalid = invalid.replace("*", "")
-    # check for invalid characters
-    if any(char in line for char in invalid):
-        # if found, check which one it is
-        for c1 in line:
-            for c2 in invalid:
-                if c1 == c2:
-                    return c1
+        match = _invalid_keywords_re.search(line)
+        group = 1
     else:
+        match = _invalid_re.search(line)
+        group = 0
+    if match is None:
         return None
+    return match.group(group)
 
 
-def valid_path(path):
+def find_invalid_chars(lines, skip_keywords=False):
+    # check a block of lines with one search
+    # returns (line index, column, char) for every invalid char
+    lines = [line.rstrip("\n") for line in lines]
+    text = "\n".join(lines)
+    # offset of the start of each line in the text
+    line_starts = [0]
+    line_starts.extend(itertools.accumulate(len(line) + 1 for line in lines))
+
+    if skip_keywords:
+        pattern = _invalid_keywords_re
+        group = 1
+    else:
+        pattern = _invalid_re
+        group = 0
+    found = []
+    for match in pattern.finditer(text):
+        pos = match.start(group)
+        if pos == -1:
+            # comment line
+            continue
+        line_idx = bisect.bisect_right(line_starts, pos) - 1
+        found.append((line_idx, pos - line_starts[line_idx], match.group(group)))
+    return found
+
+
+def find_valid_path(path):
     path = pathlib.Path(path)
     # check if path exists
     if not path.is_dir():
@@ -39,6 +78,14 @@ def valid_path(path):
     return str(path)
 
 
+def valid_path(path):
+    # an empty path if the drive isn't responding, so the file browser still opens
+    try:
+        return filesystem.call(find_valid_path, str(path))
+    except UnavailableError:
+        return ""
+
+
 def valid_filename(path):
     path = pathlib.Path(path)
     stem = path.stem
@@ -49,60 +96,46 @@ def valid_filename(path):
     return new_path
 
 
-def get_datetime(get_time=False):
+def get_datetime(get_time=False, now=None):
     prefs = get_preferences()
+    if now is None:
+        now = datetime.datetime.now()
     output = ""
     # strip to remove " " if separator is "NONE"
     date_sep = prefs.date_separator.strip()
 
-    dt = datetime.datetime
     for char_idx, char in enumerate(prefs.date_format):
         if char == "Y":
-            output += dt.now().strftime("%Y")
+            output += now.strftime("%Y")
         elif char == "M":
-            output += dt.now().strftime("%m")
+            output += now.strftime("%m")
         else:
-            output += dt.now().strftime("%d")
+            output += now.strftime("%d")
         if char_idx < 2:
             output += date_sep
 
     if get_time:
         output += date_sep
         if prefs.time_format == "HMS":
-            output += dt.now().strftime("%H") + date_sep
-        output += dt.now().strftime("%M") + date_sep
-        output += dt.now().strftime("%S")
+            output += now.strftime("%H") + date_sep
+        output += now.strftime("%M") + date_sep
+        output += now.strftime("%S")
 
     return output
 
 
-def get_references():
-    ref_path = bpy.context.scene.blendir_props.reference_path
-    references = []
-    if ref_path != "":
-        ref_path = pathlib.Path(ref_path)
-        for ref in os.listdir(ref_path):
-            if (ref_path / ref).is_file():
-                references.append(ref)
-    return references, ref_path
-
-
 def reset_props(context=bpy.context):
     props = context.scene.blendir_props
     props.old_path = ""
     props.reference_path = ""
     props.render_path = ""
-    props.bookmark_page = 0
+    props.structure_snapshot = ""
+    props.structure_name = ""
 
 
 def open_file(file):
-    platform = sys.platform
-    if platform == "win32":
-        os.startfile(file)
-    elif platform == "darwin":
-        subprocess.call(("open", str(file)))
-    else:
-        subprocess.call(("xdg-open", str(file)))
+    # doesn't wait for the program to start, see launcher
+    launcher.open_file(file)
 
 
 def open_path(path, open_folder=False):
@@ -113,6 +146,43 @@ def open_path(path, open_folder=False):
     open_file(path)
 
 
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def copy_file(src, dst):
+    # chunked copy to a temporary name, so a partial file is never left at dst
+    tmp_path = dst.with_name(dst.name + ".tmp")
+    try:
+        with src.open("rb") as fsrc, tmp_path.open("wb") as fdst:
+            while True:
+                chunk = fsrc.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                fdst.write(chunk)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+        # verify before the source is removed
+        if tmp_path.stat().st_size != src.stat().st_size:
+            raise OSError(errno.EIO, "Copy is incomplete", str(dst))
+        shutil.copystat(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        if tmp_path.exists():
+            tmp_path.unlink()
+        raise
+
+
+def move_file(src, dst):
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # rename can't cross filesystems, so copy then remove the source
+        copy_file(src, dst)
+        src.unlink()
+
+
 def get_file_path():
     return pathlib.Path(__file__)
 
@@ -130,9 +200,17 @@ def get_root_package():
     return ".".join(parts[:3])
 
 
+_extension_dir_path = None
+
+
 def get_extension_dir_path():
+    # looked up once, the state files and previews use it often
+    global _extension_dir_path
+    if _extension_dir_path is not None:
+        return _extension_dir_path
     if bpy.app.version < (4, 2, 0):
-        return get_dir_path()
+        _extension_dir_path = get_dir_path()
+        return _extension_dir_path
 
     blendir_folder = pathlib.Path(
         bpy.utils.extension_path_user(get_root_package(), create=True)
@@ -143,6 +221,7 @@ def get_extension_dir_path():
         struct_src = get_dir_path() / "structures"
         shutil.copytree(struct_src, struct_dest, dirs_exist_ok=True)
 
+    _extension_dir_path = blendir_folder
     return blendir_folder
 
 
@@ -162,6 +241,10 @@ def get_bookmark_path():
     return get_extension_dir_path() / "bookmarks.txt"
 
 
+def get_bookmark_usage_path():
+    return get_extension_dir_path() / "bookmark_usage.txt"
+
+
 def get_active_path(input_struct=None):
     if input_struct is not None:
         return get_struct_path() / f"blendir_{input_struct}.txt"
@@ -176,20 +259,3 @@ def get_addon_id():
 
 def get_preferences():
     return bpy.context.preferences.addons[get_addon_id()].preferences
-
-
-def get_panel_category():
-    path = get_panel_path()
-
-    DEFAULT_PANEL = "BlenDir"
-    if not path.is_file():
-        return DEFAULT_PANEL
-
-    with path.open("r") as f:
-        return f.read().strip()
-
-
-def set_panel_category(location):
-    path = get_panel_path()
-    with path.open("w") as f:
-        f.write(location)